@@ -1,29 +1,187 @@
+import time
+startup_started = time.perf_counter()  # Before anything else is imported, for --profile-startup
+
 import sys
-import json
 import os
-from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget, QLabel, QDialog, QLineEdit, QFormLayout, QProgressBar, QHBoxLayout, QComboBox, QColorDialog, QMessageBox, QFileDialog 
-from PyQt5.QtGui import QColor
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtMultimedia import QSound
+import json
+import argparse
 import random
+from PyQt5.QtWidgets import QApplication, QShortcut, QMainWindow, QPushButton, QVBoxLayout, QWidget, QLabel, QDialog, QLineEdit, QFormLayout, QProgressBar, QHBoxLayout, QComboBox, QColorDialog, QMessageBox, QFileDialog, QCompleter, QGridLayout, QTableWidget, QTableWidgetItem, QHeaderView
+from PyQt5.QtGui import QColor, QIcon, QKeySequence, QPalette, QPixmap
+from PyQt5.QtCore import QEvent, QTimer, Qt, pyqtSignal, QAbstractListModel, QModelIndex, QStringListModel
+import math
+from session import DEFAULT_GRAPH, DEFAULT_PHASE_GRAPH, Session, SessionScheduler, Timer, default_timers, apply_preset, check_settings
+from instrumentation import Instrumentation
+from presets import DEFAULT_PRESETS, PresetStore
+from history import SessionHistory
 
 current_dir = os.path.dirname(os.path.realpath(__file__))
-appdata = os.getenv('APPDATA')
+
+
+# Where presets, history and timing exports live on this platform
+def preset_directory():
+    if sys.platform == 'win32':
+        base = os.getenv('APPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.getenv('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+    return os.path.join(base, 'PTAW')
+
+
 global presets_file 
-presets_file = os.path.join(appdata, 'PTAW', 'presets.json')
+presets_file = os.path.join(preset_directory(), 'presets.json')
+presets_store_file = os.path.join(preset_directory(), 'presets.db')
 
 
-class Timer:
-    def __init__(self, name, min_time, max_time, color, sound_effect):
-        self.name = name
-        self.min_time = min_time
-        self.max_time = max_time
-        self.color = color
-        self.sound_effect = os.path.join(current_dir, sound_effect)
+# QtMultimedia is only imported once audio is needed, returns None if it can't be loaded
+def create_sound_cache(parent, instrumentation, timers):
+    try:
+        from sounds import SoundCache
+    except ImportError as e:
+        print(f"Sound disabled: {e}")
+        return None
+    sounds = SoundCache(parent, instrumentation)
+    sounds.retain([timer.sound_effect for timer in timers])
+    return sounds
+
+
+# Time per startup phase for --profile-startup
+class StartupProfiler:
+    def __init__(self):
+        self.last = startup_started
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000))
+        self.last = now
+
+    def report(self):
+        return {'phases_ms': dict(self.phases), 'total_ms': (self.last - startup_started) * 1000}
+
+
+# Preset names for the dropdown, pulled from the store a batch at a time as the list is scrolled
+class PresetListModel(QAbstractListModel):
+    def __init__(self, presets, batch_size=200, parent=None):
+        super(PresetListModel, self).__init__(parent)
+        self.presets = presets
+        self.batch_size = batch_size
+        self.names = []
+        self.exhausted = False
+        self.fetchMore()  # First batch, so the dropdown has something to show
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role in (Qt.DisplayRole, Qt.EditRole):
+            return self.names[index.row()]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        names = self.presets.names(len(self.names), self.batch_size)
+        if len(names) < self.batch_size:
+            self.exhausted = True
+        if names:
+            self.beginInsertRows(QModelIndex(), len(self.names), len(self.names) + len(names) - 1)
+            self.names.extend(names)
+            self.endInsertRows()
+
+    # A newly saved preset, rows not fetched yet will pick it up from the store
+    def add(self, name):
+        if self.exhausted and name not in self.names:
+            self.beginInsertRows(QModelIndex(), len(self.names), len(self.names))
+            self.names.append(name)
+            self.endInsertRows()
+
+    def remove(self, name):
+        if name not in self.names:  # Not fetched yet
+            return
+        row = self.names.index(name)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.names[row]
+        self.endRemoveRows()
+
+
+# Phase colours are stored as CSS strings, which QColor can't parse in the rgba() form
+def parse_color(text):
+    if text.startswith('rgb'):
+        values = [float(value) for value in text[text.index('(') + 1:text.rindex(')')].split(',')]
+        color = QColor(int(values[0]), int(values[1]), int(values[2]))
+        if len(values) > 3:
+            color.setAlphaF(values[3])
+        return color
+    return QColor(text)
+
+
+# Palette that paints a widget and its children in a phase colour
+def compile_palette(base_palette, color):
+    palette = QPalette(base_palette)
+    qcolor = parse_color(color)
+    for role in (QPalette.Window, QPalette.Button, QPalette.Base):
+        palette.setColor(role, qcolor)
+    return palette
+
+
+# Compiled phase palettes by colour, each one built once on top of a window's own palette
+class PaletteCache:
+    def __init__(self, base_palette):
+        self.base_palette = base_palette
+        self.palettes = {}
+
+    def get(self, color):
+        if color not in self.palettes:
+            self.palettes[color] = compile_palette(self.base_palette, color)
+        return self.palettes[color]
+
+
+# Countdown text and progress bar for the seconds left in a phase. The bar only moves in steps
+# of about one pixel, so most display ticks change nothing and the renderer skips them.
+def render_countdown(renderer, progress_bar, countdown_label, remaining):
+    maximum = renderer.value(progress_bar, 'setMaximum', progress_bar.maximum())
+    step = max(1, maximum // max(1, progress_bar.width()))
+    renderer.set(progress_bar, 'setValue', int(remaining * 100) // step * step)
+    renderer.set(countdown_label, 'setText', f'Time remaining: {int(remaining) + 1} seconds')
+
+
+# Icon filled with a colour, for the colour buttons. A style sheet would do the same, but Qt
+# re-polishes styled widgets on every show and that slowly grows memory when the dialog is reused.
+def color_swatch(color):
+    pixmap = QPixmap(32, 16)
+    pixmap.fill(parse_color(color))
+    return QIcon(pixmap)
+
+
+# Remembers the value each widget last showed and skips setters that would not change anything.
+# Changes are queued with set() and applied together by flush(), once per display frame.
+class Renderer:
+    def __init__(self):
+        self.rendered = {}  # (widget, setter) -> value
+        self.pending = {}
+
+    def set(self, widget, setter, value):
+        key = (widget, setter)
+        if key in self.rendered and self.rendered[key] == value:
+            self.pending.pop(key, None)
+        else:
+            self.pending[key] = value
+
+    # The value a widget will show after the next flush
+    def value(self, widget, setter, default=None):
+        key = (widget, setter)
+        return self.pending.get(key, self.rendered.get(key, default))
+
+    def flush(self):
+        for (widget, setter), value in self.pending.items():
+            getattr(widget, setter)(value)
+            self.rendered[(widget, setter)] = value
+        self.pending.clear()
+
 
-    def start(self):
-        return random.uniform(self.min_time, self.max_time)
-    
 class SettingsWindow(QDialog):
     def __init__(self, parent=None, timers=None, presets=None, hit_count_min=None, hit_count_max=None):
         super(SettingsWindow, self).__init__(parent)
@@ -47,8 +205,20 @@ class SettingsWindow(QDialog):
 
         self.preset_dropdown = QComboBox(self)  # Create a new dropdown
         self.preset_dropdown.setEditable(True)  # Make the dropdown editable
-        self.preset_dropdown.addItems(self.presets.keys())  # Add the names of the presets to the dropdown
+
+        # Type-ahead, matching names are looked up in the store as the user types
+        self.search_model = QStringListModel(self)
+        self.search_text = None
+        self.search_complete = False
+        self.preset_completer = QCompleter(self.search_model, self)
+        self.preset_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.preset_completer.activated[str].connect(self.load_named_preset)
+        self.preset_dropdown.setCompleter(self.preset_completer)  # Before setModel, the default completer would fetch every name
+
+        self.preset_model = PresetListModel(self.presets, parent=self)  # Names are fetched lazily as the list scrolls
+        self.preset_dropdown.setModel(self.preset_model)
         self.preset_dropdown.currentIndexChanged.connect(self.load_preset)  # Connect the dropdown to the load_preset method
+        self.preset_dropdown.lineEdit().textEdited.connect(self.filter_presets)
         self.preset_dropdown.setCurrentText(self.last_preset)  # Set the current text to the last activated preset
         self.layout.addRow('Presets', self.preset_dropdown)  # Add the dropdown to the layout
 
@@ -74,19 +244,9 @@ class SettingsWindow(QDialog):
 
 
 
-        self.inputs = []
-        self.color_buttons = []  # List to store the color buttons
-        for timer in self.timers:
-            min_input = QLineEdit(str(timer.min_time))
-            max_input = QLineEdit(str(timer.max_time))
-            self.inputs.append((min_input, max_input))
-            self.layout.addRow(f'{timer.name} min sec', min_input)
-            self.layout.addRow(f'{timer.name} max sec', max_input)
-
-            color_button = QPushButton('Select Color', self)  # Create a new button for selecting the color
-            color_button.clicked.connect(lambda _, t=timer: self.select_color(t))  # Connect the button to the select_color method
-            self.color_buttons.append(color_button)
-            self.layout.addRow(f'{timer.name} color', color_button)  # Add the button to the layout
+        self.phase_layout = QFormLayout()  # Rebuilt when a preset brings a different set of phases
+        self.phase_names = None
+        self.layout.addRow(self.phase_layout)
 
         self.hit_count_min_input = QLineEdit(str(self.hit_count_min))
         self.hit_count_max_input = QLineEdit(str(self.hit_count_max))
@@ -98,6 +258,9 @@ class SettingsWindow(QDialog):
         self.layout.addRow('Hit Sound', self.hit_sound_button)
         self.layout.addRow('Hold Sound', self.hold_sound_button)
         self.layout.addRow('Release Sound', self.release_sound_button)
+        cue_library_button = QPushButton('Cue Library', self)
+        cue_library_button.clicked.connect(self.parent().open_cue_library)
+        self.layout.addRow(cue_library_button)
 
         apply_button = QPushButton('Apply', self)
         apply_button.clicked.connect(self.apply)
@@ -113,24 +276,77 @@ class SettingsWindow(QDialog):
     # Select Prepare Sound
         
     def select_prepare_sound(self):
-        self.prepare_sound_path = QFileDialog.getOpenFileName(self, 'Select Prepare Sound', '', 'Sound Files (*.wav)')[0]
+        path = QFileDialog.getOpenFileName(self, 'Select Prepare Sound', '', 'Sound Files (*.wav)')[0]
+        if path:
+            self.ingest_sound('prepare_sound_path', path, self.prepare_sound_button)
 
     def select_hit_sound(self):
-        self.hit_sound_path = QFileDialog.getOpenFileName(self, 'Select Hit Sound', '', 'Sound Files (*.wav)')[0]
+        path = QFileDialog.getOpenFileName(self, 'Select Hit Sound', '', 'Sound Files (*.wav)')[0]
+        if path:
+            self.ingest_sound('hit_sound_path', path, self.hit_sound_button)
 
     def select_hold_sound(self):
-        self.hold_sound_path = QFileDialog.getOpenFileName(self, 'Select Hold Sound', '', 'Sound Files (*.wav)')[0]
+        path = QFileDialog.getOpenFileName(self, 'Select Hold Sound', '', 'Sound Files (*.wav)')[0]
+        if path:
+            self.ingest_sound('hold_sound_path', path, self.hold_sound_button)
 
     def select_release_sound(self):
-        self.release_sound_path = QFileDialog.getOpenFileName(self, 'Select Release Sound', '', 'Sound Files (*.wav)')[0]
+        path = QFileDialog.getOpenFileName(self, 'Select Release Sound', '', 'Sound Files (*.wav)')[0]
+        if path:
+            self.ingest_sound('release_sound_path', path, self.release_sound_button)
+
+    # Validate and convert the file in the background, the setting only changes once the processed cue is ready
+    def ingest_sound(self, attribute, path, button):
+        text = button.text()
+        button.setText(f'{text} (processing...)')
+
+        def on_ready(cue):
+            setattr(self, attribute, cue)
+            button.setText(text)
+
+        def on_error(error):
+            button.setText(text)
+            QMessageBox.warning(self, 'Sound not usable', str(error))
+
+        self.parent().ingest_cue(path, on_ready, on_error)
+
+    # Narrow the type-ahead list, reusing the previous matches while the user keeps typing
+    def filter_presets(self, text, limit=50):
+        previous = self.search_text
+        if self.search_complete and previous is not None and text.lower().startswith(previous.lower()):
+            names = [name for name in self.search_model.stringList() if text.lower() in name.lower()]
+        else:
+            names = self.presets.search(text, limit)
+            self.search_complete = len(names) < limit
+        self.search_text = text
+        self.search_model.setStringList(names)
+
+    # Phase times and hit count range from the inputs, None after telling the user what's wrong
+    def read_inputs(self):
+        try:
+            times = [(float(min_input.text()), float(max_input.text())) for min_input, max_input in self.inputs]
+            hit_count_min = int(self.hit_count_min_input.text())
+            hit_count_max = int(self.hit_count_max_input.text())
+        except ValueError:
+            QMessageBox.warning(self, 'Invalid settings', 'Times must be numbers and hit counts whole numbers')
+            return None
+        try:
+            checked = [Timer(timer.name, min_time, max_time, timer.color, '') for timer, (min_time, max_time) in zip(self.timers, times)]
+            check_settings(checked, self.parent().graph.ranges(hit_count_min, hit_count_max))
+        except ValueError as e:
+            QMessageBox.warning(self, 'Invalid settings', str(e))
+            return None
+        return times, hit_count_min, hit_count_max
 
     # Apply Settings to current session
     def apply(self):
-        for timer, (min_input, max_input) in zip(self.timers, self.inputs):
-            timer.min_time = float(min_input.text())
-            timer.max_time = float(max_input.text())
-        self.hit_count_min = int(self.hit_count_min_input.text())
-        self.hit_count_max = int(self.hit_count_max_input.text())
+        inputs = self.read_inputs()
+        if inputs is None:
+            return
+        times, self.hit_count_min, self.hit_count_max = inputs
+        for timer, (min_time, max_time) in zip(self.timers, times):
+            timer.min_time = min_time
+            timer.max_time = max_time
         self.parent().update_sound_paths(self.prepare_sound_path, self.hit_sound_path, self.hold_sound_path, self.release_sound_path)
         
         self.parent().update_hit_count_range(self.hit_count_min, self.hit_count_max)
@@ -140,72 +356,160 @@ class SettingsWindow(QDialog):
     # Save Preset
     def save_preset(self):
         preset_name = self.preset_dropdown.currentText()
-        preset = [(int(min_input.text()), int(max_input.text()), timer.color) for timer, (min_input, max_input) in zip(self.timers, self.inputs)]
-        preset.append(('Hit count', int(self.hit_count_min_input.text()), int(self.hit_count_max_input.text())))
+        inputs = self.read_inputs()
+        if inputs is None:
+            return
+        times, hit_count_min, hit_count_max = inputs
+        preset = [(int(min_time), int(max_time), timer.color) for timer, (min_time, max_time) in zip(self.timers, times)]
+        if self.parent().graph.spec != DEFAULT_GRAPH:
+            preset.append(('Graph', self.parent().graph.spec))  # Before the hit count, which stays last
+        preset.append(('Hit count', hit_count_min, hit_count_max))
 
         if preset_name in self.presets:
             reply = QMessageBox.question(self, 'Overwrite preset', f'A preset named "{preset_name}" already exists. Do you want to overwrite it?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.No:
                 return
-        else:
-            self.preset_dropdown.addItem(preset_name)
 
-        self.presets[preset_name] = preset
+        self.presets[preset_name] = preset  # Only this preset is written
+        self.preset_model.add(preset_name)
+        self.search_text = None  # Type-ahead matches are stale now
         self.last_preset = preset_name
 
-        with open(presets_file, 'w') as f:  # Write the updated presets to the file
-            json.dump(self.presets, f)
-
     # Delete Preset
     def delete_preset(self):
         preset_name = self.preset_dropdown.currentText()  # Get the name of the selected preset
+        if preset_name not in self.presets:
+            return
         del self.presets[preset_name]  # Delete the preset
-        self.preset_dropdown.removeItem(self.preset_dropdown.currentIndex())  # Remove the preset from the dropdown
-
-        with open(presets_file, 'w') as f:  # Write the updated presets to the file
-            json.dump(self.presets, f)
+        self.preset_model.remove(preset_name)  # Remove the preset from the dropdown
+        self.search_text = None  # Type-ahead matches are stale now
 
     # Load Preset
     def load_preset(self, index):
-        preset_name = self.preset_dropdown.itemText(index)
-        preset = self.presets[preset_name]
-        for i, timer in enumerate(self.timers):
-            preset_timer = preset[i]
-            timer.min_time = preset_timer[0]
-            timer.max_time = preset_timer[1]
-            timer.color = preset_timer[2]
-        self.hit_count_min, self.hit_count_max = preset[-1][1], preset[-1][2]  # Load hit_count_min and hit_count_max
+        self.load_named_preset(self.preset_dropdown.itemText(index))
+
+    def load_named_preset(self, preset_name):
+        if preset_name not in self.presets:
+            return
+        preset = self.presets[preset_name]  # Single indexed lookup in the store
+        try:
+            graph, self.hit_count_min, self.hit_count_max = apply_preset(self.timers, preset)  # Load hit_count_min and hit_count_max
+        except ValueError as e:  # The preset's phase graph doesn't compile
+            QMessageBox.warning(self, 'Invalid preset', f'{preset_name}: {e}')
+            return
+        self.parent().set_graph(graph)  # The timers already follow the preset's phases
         self.update_settings_UI()
 
+    # Bring a reused dialog in line with the App, only touching fields whose values changed
+    def refresh(self, hit_count_min, hit_count_max):
+        self.hit_count_min = hit_count_min
+        self.hit_count_max = hit_count_max
+        self.prepare_sound_path = self.parent().prepare_sound_path  # Drop selections that were never applied
+        self.hit_sound_path = self.parent().hit_sound_path
+        self.hold_sound_path = self.parent().hold_sound_path
+        self.release_sound_path = self.parent().release_sound_path
+        self.update_settings_UI()
+
+    def build_phase_rows(self):
+        while self.phase_layout.rowCount():
+            self.phase_layout.removeRow(0)
+        self.inputs = []
+        self.color_buttons = []  # List to store the color buttons
+        for timer in self.timers:
+            min_input = QLineEdit(str(timer.min_time))
+            max_input = QLineEdit(str(timer.max_time))
+            self.inputs.append((min_input, max_input))
+            self.phase_layout.addRow(f'{timer.name} min sec', min_input)
+            self.phase_layout.addRow(f'{timer.name} max sec', max_input)
+
+            color_button = QPushButton('Select Color', self)  # Create a new button for selecting the color
+            color_button.clicked.connect(lambda _, t=timer: self.select_color(t))  # Connect the button to the select_color method
+            self.color_buttons.append(color_button)
+            self.phase_layout.addRow(f'{timer.name} color', color_button)  # Add the button to the layout
+        self.phase_names = [timer.name for timer in self.timers]
+
     def update_settings_UI(self):
+        if self.phase_names != [timer.name for timer in self.timers]:
+            self.build_phase_rows()
         for timer, (min_input, max_input), color_button in zip(self.timers, self.inputs, self.color_buttons):
-            min_input.setText(str(timer.min_time))
-            max_input.setText(str(timer.max_time))
-            color_button.setStyleSheet(f"background-color: {timer.color};")
-        self.hit_count_min_input.setText(str(self.hit_count_min))
-        self.hit_count_max_input.setText(str(self.hit_count_max))
+            self.set_text(min_input, str(timer.min_time))
+            self.set_text(max_input, str(timer.max_time))
+            if color_button.property('color') != timer.color:
+                color_button.setProperty('color', timer.color)
+                color_button.setIcon(color_swatch(timer.color))
+        self.set_text(self.hit_count_min_input, str(self.hit_count_min))
+        self.set_text(self.hit_count_max_input, str(self.hit_count_max))
+
+    def set_text(self, line_edit, text):
+        if line_edit.text() != text:
+            line_edit.setText(text)
         
+# The cues in use, how long each one is and how long it takes to start playing
+class CueLibraryDialog(QDialog):
+    cues = (('Prepare', 'prepare_sound_path'), ('Hit', 'hit_sound_path'),
+            ('Hold', 'hold_sound_path'), ('Release', 'release_sound_path'))
+
+    def __init__(self, parent):
+        super(CueLibraryDialog, self).__init__(parent)
+        self.setWindowTitle('Cue Library')
+        self.table = QTableWidget(len(self.cues), 6, self)
+        self.table.setHorizontalHeaderLabels(['Cue', 'File', 'Duration', 'Status', 'Start latency', ''])
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        for row, (name, attribute) in enumerate(self.cues):
+            self.table.setItem(row, 0, QTableWidgetItem(name))
+            preview_button = QPushButton('Preview', self)
+            preview_button.clicked.connect(lambda _, attribute=attribute: self.preview(attribute))
+            self.table.setCellWidget(row, 5, preview_button)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.table)
+        self.resize(640, 200)
+
+    def refresh(self):
+        from ingest import duration
+        sounds = self.parent().sounds
+        for row, (name, attribute) in enumerate(self.cues):
+            path = getattr(self.parent(), attribute)
+            source = self.parent().cue_sources.get(path, path)  # The file the user picked, not its processed copy
+            seconds = duration(path)
+            length = 'unreadable' if seconds is None else f'{seconds:.2f} s'
+            latency = sounds.path_latency.get(path) if sounds is not None else None
+            file_item = QTableWidgetItem(os.path.basename(source))
+            file_item.setToolTip(source)
+            self.table.setItem(row, 1, file_item)
+            self.table.setItem(row, 2, QTableWidgetItem(length))
+            self.table.setItem(row, 3, QTableWidgetItem(sounds.status(path) if sounds is not None else 'sound disabled'))
+            self.table.setItem(row, 4, QTableWidgetItem('preview to measure' if latency is None else f'{latency * 1000:.1f} ms'))
+
+    def preview(self, attribute):
+        sounds = self.parent().sounds
+        if sounds is not None and sounds.play(getattr(self.parent(), attribute)):
+            QTimer.singleShot(250, self.refresh)  # Once playback has started and its latency is known
+
+
 class App(QMainWindow):
-    def __init__(self):
+    cue_ingested = pyqtSignal(object, object)  # Future, (source path, on_ready, on_error)
+
+    def __init__(self, seed=None, publisher=None):
         super().__init__()
-        self.timer_index = 0
+        self.seed = seed  # Replay a reported session instead of drawing a new one
+        self.publisher = publisher  # Mirrors transitions to follower displays
         self.hit_count_min = 2  # Set the minimum hit count
         self.hit_count_max = 3  # Set the maximum hit count
-        self.hit_count = 0
-        self.timers = [
-            Timer('Edging', 120, 240, "rgba(24, 40, 84,1)", ""),
-            Timer('Prepare', 10, 10, "rgba(34, 156, 23,1)", "prepare.wav"),
-            Timer('Hit', 5, 15, "rgba(173, 5, 39,1)", "hit.wav"),
-            Timer('Hold', 10, 20, "rgba(81, 2, 156,1)", "hold.wav"),
-            Timer("Release", 5,5, "rgba(4, 51, 181,1)", "release.wav")
-        ]
-        self.presets = self.load_presets()
-        if 'Default' in self.presets:
-            self.load_preset('Default')
-        else:
-            # Load the first preset in the array if 'Default' doesn't exist
-            first_preset_name = next(iter(self.presets))
-            self.load_preset(first_preset_name)
+        self.timers = default_timers()
+        self.graph = DEFAULT_PHASE_GRAPH  # Phases and transitions, compiled once per preset
+        self.session = Session(self.timers, self.hit_count_min, self.hit_count_max, graph=self.graph)
+        self.session.subscribe(self.on_transition)
+        self.history = SessionHistory(os.path.join(os.path.dirname(presets_file), 'history'))
+        self.session.subscribe(self.record_history)
+        self.last_hit_counter = 0
+        QApplication.instance().aboutToQuit.connect(self.history.close)
+        if self.publisher is not None:
+            from broadcast import transition_message
+            self.session.subscribe(lambda event: self.publisher.publish(transition_message(event)))
+            QApplication.instance().aboutToQuit.connect(self.publisher.close)
+        self.presets = None  # Loaded by load_startup_presets once the window is up
+        self.settings_window = None
 
         if getattr(sys, 'frozen', False):
             # The application is bundled
@@ -214,13 +518,16 @@ class App(QMainWindow):
             # The application is run from a script
             base_path = os.path.dirname(__file__)
 
-        self.sound_effect = ""
-        self.temp_hit_counter = 0
-        self.hit_counter = 0
         self.prepare_sound_path = os.path.join(base_path, 'prepare.wav')
         self.hit_sound_path = os.path.join(base_path, 'hit.wav')
         self.hold_sound_path = os.path.join(base_path, 'hold.wav')
         self.release_sound_path = os.path.join(base_path, 'release.wav')
+        self.instrumentation = Instrumentation()
+        self.sounds = None  # QtMultimedia is only loaded on the first Start
+        self.ingester = None
+        self.cue_sources = {}  # Processed cue path to the file it was made from, for showing the user
+        self.cue_library = None
+        self.cue_ingested.connect(self.on_cue_ingested)
         self.initUI()
 
     def initUI(self):
@@ -243,11 +550,27 @@ class App(QMainWindow):
         self.label.setFont(font)
 
         # Countdown Labels
-        self.timer_qt = QTimer()
-        self.timer_qt.timeout.connect(self.update_timer)
+        # The phase timer fires once per transition at the phase's absolute deadline,
+        # the display timer only repaints the countdown and runs slower when hidden
+        self.phase_timer = QTimer()
+        self.phase_timer.setSingleShot(True)
+        self.phase_timer.setTimerType(Qt.PreciseTimer)
+        self.phase_timer.timeout.connect(self.update_timer)
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(self.display_tick)
+        self.last_display_tick = 0.0
+        self.pending_repaint_cost = None  # Refresh time of the last transition, until its paint
+        self.renderer = Renderer()
+        self.default_palette = self.palette()
+        self.palettes = PaletteCache(self.default_palette)
+
+        # Export timing histograms
+        self.export_shortcut = QShortcut(QKeySequence('Ctrl+T'), self)
+        self.export_shortcut.activated.connect(self.export_timing)
         self.countdown_label = QLabel()
         self.countdown_label.setAlignment(Qt.AlignCenter)
         self.progress_bar = QProgressBar()
+        self.progress_bar.setInvertedAppearance(True)
         self.progress_bar.setVisible(False)
 
         self.hitcount_label = QLabel()
@@ -289,44 +612,102 @@ class App(QMainWindow):
     # -=-=- Settings Window -=-=-
     # Open Settings
     def open_settings(self):
-        self.settings_window = SettingsWindow(self, self.timers, self.presets, self.hit_count_min, self.hit_count_max)
+        self.load_startup_presets()
+        if self.settings_window is None:  # Built once, then reused for every open
+            self.settings_window = SettingsWindow(self, self.timers, self.presets, self.hit_count_min, self.hit_count_max)
+        else:
+            self.settings_window.refresh(self.hit_count_min, self.hit_count_max)
         self.settings_window.show()
     
-    def load_preset(self, preset_name):
-        preset = self.presets[preset_name]
-        for i, timer in enumerate(self.timers):
-            preset_timer = preset[i]
-            timer.min_time = preset_timer[0]
-            timer.max_time = preset_timer[1]
-            timer.color = preset_timer[2]
-        self.hit_count_min, self.hit_count_max = preset[-1][1], preset[-1][2]  # Load hit_count_min and hit_count_max
+    def load_preset(self, preset_name, preset=None):
+        if preset is None:
+            preset = self.presets[preset_name]
+        try:
+            graph, hit_count_min, hit_count_max = apply_preset(self.timers, preset)
+        except ValueError as e:  # The preset's phase graph doesn't compile, keep the built-in phases
+            print(f"Preset {preset_name} not loaded: {e}")
+            return
+        self.set_graph(graph)
+        self.update_hit_count_range(hit_count_min, hit_count_max)  # Load hit_count_min and hit_count_max
+
+    # Switch to a preset's phase graph, the timers must already match its phases
+    def set_graph(self, graph):
+        self.graph = graph
+        self.session.graph = graph
+        self.update_sound_paths(self.prepare_sound_path, self.hit_sound_path, self.hold_sound_path, self.release_sound_path)
         
     def load_presets(self):
-        if not os.path.exists(presets_file):  # If the file does not exist
-            os.makedirs(os.path.dirname(presets_file), exist_ok=True)  # Create the directory if it does not exist
-            presets = {  # Default presets
-                'Default': [(120, 240, "rgba(24, 40, 84,1)"), (10, 10, "rgba(34, 156, 23,1)"), (5, 15, "rgba(173, 5, 39,1)"), (10, 20, "rgba(81, 2, 156,1)"), (5, 5, "rgba(4, 51, 181,1)"), ('Hit count', 1, 3)],
-                'Short and Hard': [(120, 240, "rgba(24, 40, 84,1)"), (10, 10, "rgba(34, 156, 23,1)"), (5, 15, "rgba(173, 5, 39,1)"), (10, 20, "rgba(81, 2, 156,1)"), (5, 5, "rgba(4, 51, 181,1)"), ('Hit count', 1, 3)],
-                'Long Endurance': [(300, 600, "rgba(24, 40, 84,1)"), (9, 9, "rgba(34, 156, 23,1)"), (10, 10, "rgba(173, 5, 39,1)"), (11, 11, "rgba(81, 2, 156,1)"), (5, 5, "rgba(4, 51, 181,1)"), ('Hit count', 2, 4)],
-            }
-            with open(presets_file, 'w') as f:  # Create the file and write the default presets
-                json.dump(presets, f)
-        else:  # If the file exists
-            with open(presets_file, 'r') as f:  # Read the presets from the file
-                presets = json.load(f)
-        return presets
-    
-    def save(self):
-        for timer, (min_input, max_input) in zip(self.timers, self.inputs):
-            timer.min_time = float(min_input.text())
-            timer.max_time = float(max_input.text())
-        with open('presets.json', 'w') as f:  # Write the updated presets to the file
-            json.dump(self.presets, f)
-        self.close()
+        return PresetStore(presets_store_file)  # Migrates presets.json or writes the default presets on first run
+
+    # Called after the first paint, so opening the preset store never delays the window
+    def load_startup_presets(self):
+        if self.presets is not None:
+            return
+        self.presets = self.load_presets()
+        if 'Default' in self.presets:
+            self.load_preset('Default')
+        elif len(self.presets):
+            # Load the first preset in the array if 'Default' doesn't exist
+            first_preset_name = next(iter(self.presets))
+            self.load_preset(first_preset_name)
+        else:
+            self.load_preset('Default', DEFAULT_PRESETS['Default'])  # Empty library, e.g. presets.json couldn't be migrated
+
+    # Audio is set up on the first Start
+    def ensure_sounds(self):
+        if self.sounds is None:
+            self.sounds = create_sound_cache(self, self.instrumentation, self.timers)
+        return self.sounds
+
+    def load_sound(self, path):
+        if self.sounds is not None:
+            self.sounds.load(path)
+
+    # Process a cue on the ingest thread pool, on_ready gets the processed copy's path back on the Qt thread
+    def ingest_cue(self, path, on_ready, on_error=None):
+        if self.ingester is None:
+            from ingest import CueIngester
+            self.ingester = CueIngester(os.path.join(preset_directory(), 'cues'))
+            QApplication.instance().aboutToQuit.connect(self.ingester.close)
+        future = self.ingester.submit(path)
+        future.add_done_callback(lambda future: self.cue_ingested.emit(future, (path, on_ready, on_error)))
+
+    def on_cue_ingested(self, future, callbacks):
+        source, on_ready, on_error = callbacks
+        try:
+            cue = future.result()
+        except Exception as e:  # ImportError means NumPy isn't installed, anything else is a file we couldn't handle
+            print(f"Cue not processed: {e}")
+            if on_error is not None:
+                on_error(e)
+            return
+        self.cue_sources[cue] = source
+        self.load_sound(cue)
+        on_ready(cue)
+
+    # Swap the bundled cues for processed copies, unless the user picked other files in the meantime
+    def ingest_bundled_cues(self):
+        for attribute in ('prepare_sound_path', 'hit_sound_path', 'hold_sound_path', 'release_sound_path'):
+            source = getattr(self, attribute)
+            self.ingest_cue(source, lambda cue, attribute=attribute, source=source: self.replace_cue(attribute, source, cue))
+
+    def replace_cue(self, attribute, source, cue):
+        if getattr(self, attribute) == source:
+            setattr(self, attribute, cue)
+            self.update_sound_paths(self.prepare_sound_path, self.hit_sound_path, self.hold_sound_path, self.release_sound_path)
+
+    def open_cue_library(self):
+        self.ensure_sounds()
+        if self.cue_library is None:
+            self.cue_library = CueLibraryDialog(self)
+        self.cue_library.refresh()
+        self.cue_library.show()
     
     def update_hit_count_range(self, min_hits, max_hits):
         self.hit_count_min = min_hits
         self.hit_count_max = max_hits
+        self.session.hit_count_min = min_hits
+        self.session.hit_count_max = max_hits
 
     def update_sound_paths(self, prepare, hit, hold, release):
         self.prepare_sound_path = prepare
@@ -334,22 +715,24 @@ class App(QMainWindow):
         self.hold_sound_path = hold
         self.release_sound_path = release
 
-        # Update the sound_effect attribute of each Timer object
-        for timer in self.timers:
-            if timer.name == 'Prepare':
-                timer.sound_effect = self.prepare_sound_path
-            elif timer.name == 'Hit':
-                timer.sound_effect = self.hit_sound_path
-            elif timer.name == 'Hold':
-                timer.sound_effect = self.hold_sound_path
-            elif timer.name == 'Release':
-                timer.sound_effect = self.release_sound_path
+        # Update the sound_effect attribute of each Timer object from the sound slot of its phase
+        paths = {'prepare': prepare, 'hit': hit, 'hold': hold, 'release': release}
+        for timer, slot in zip(self.timers, self.graph.sound_slots):
+            timer.sound_effect = paths.get(slot, '')
+        if self.sounds is not None:
+            self.sounds.retain([timer.sound_effect for timer in self.timers])  # Decode new cues, drop replaced ones
 
     # -=-=- Timer Handling -=-=-
 
     # Start Timers
     def start_timers(self):
         print("start_timers called")
+        self.load_startup_presets()
+        try:
+            check_settings(self.timers, self.graph.ranges(self.hit_count_min, self.hit_count_max))
+        except ValueError as e:  # e.g. a preset saved with times the session can't use
+            QMessageBox.warning(self, 'Invalid settings', str(e))
+            return
         self.setWindowFlags(self.windowFlags() | Qt.WindowStaysOnTopHint)  # Set the window flag
         self.show()
         self.setWindowOpacity(0.7)
@@ -359,92 +742,339 @@ class App(QMainWindow):
         self.start_button.setText('Stop')
         self.start_button.clicked.disconnect()
         self.start_button.clicked.connect(self.stop_timers)
-        if self.timer_qt.isActive() == False:
-            self.timer_index = 0
-        self.timer_qt.start(10)
-
-    def handle_prepare_timer(self):
-        self.hit_count = random.randint(self.hit_count_min, self.hit_count_max)  # Select a random hit count
-        print(f"Hit count: {self.hit_count}")
-        self.label.setText(f'{self.timers[self.timer_index].name} - {self.hit_count} hit')
-
-    def handle_hit_timer(self):
-        self.temp_hit_counter += 1
-        self.label.setText(f'{self.timers[self.timer_index].name} - {self.temp_hit_counter} of {self.hit_count}')
-        self.hit_counter += 1  # Increment the hit counter
-        self.hitcount_label.setText(f'Total hits: {self.hit_counter}')
-
-    def handle_hold_timer(self):
-        self.label.setText(f'{self.timers[self.timer_index].name} - {self.temp_hit_counter} of {self.hit_count}')
-
-    def handle_release_timer(self):
-        if self.temp_hit_counter < self.hit_count:  # If the hit count has not been reached
-            self.label.setText(f'{self.timers[self.timer_index].name} - {self.temp_hit_counter} of {self.hit_count}')
-            self.timer_index = 2  # Go back to the Hit timer
-        else:
-            self.label.setText(f'{self.timers[self.timer_index].name}')
-            self.timer_index = 0  # Go back to the Edging timer
-            self.temp_hit_counter = 0  # Reset the hit counter
-        return True  # Indicate that the timer_index has been manually set
-
-    # Map the timer index to the event handler
-    timer_event_handlers = {
-        1: handle_prepare_timer,
-        2: handle_hit_timer,
-        3: handle_hold_timer,
-        4: handle_release_timer,
-    }
+        self.ensure_sounds()
+        self.palettes = PaletteCache(self.default_palette)  # Only this session's colours, built before the first phase
+        for timer in self.timers:
+            self.palettes.get(timer.color)
+        seed = random.randrange(2 ** 32) if self.seed is None else self.seed
+        print(f"Session seed: {seed}")
+        self.history.record('start', s=seed)  # Before start() emits the first phase
+        self.session.start(seed)
+        self.refresh_display()
+        self.last_display_tick = 0.0
+        self.phase_timer.start(self.msecs_until_deadline())
+        self.display_timer.start(self.display_interval())
+
+    # Milliseconds until the current phase deadline, rounded up so we never wake early
+    def msecs_until_deadline(self):
+        return math.ceil(self.session.remaining() * 1000)
+
+    # Display refresh rate, slowed right down when nobody can see the window
+    def display_interval(self):
+        if not self.isVisible() or self.isMinimized():
+            return 1000
+        return 50
+
+    def display_tick(self):
+        now = time.monotonic()
+        if self.last_display_tick:
+            self.instrumentation.record('tick_jitter', now - self.last_display_tick - self.display_timer.interval() / 1000)
+        self.last_display_tick = now
+        self.refresh_display()
+
+    # Refresh Display
+    def refresh_display(self):
+        render_countdown(self.renderer, self.progress_bar, self.countdown_label, self.session.remaining())
+        self.renderer.flush()
+        interval = self.display_interval()
+        if self.display_timer.interval() != interval:
+            self.display_timer.setInterval(interval)
+
     # Update Timer
     def update_timer(self):
-        value = self.progress_bar.value()
-        self.progress_bar.setInvertedAppearance(True)
-        if value > 0:
-            self.progress_bar.setValue(value - 1)
-            self.countdown_label.setText(f'Time remaining: {value // 100 + 1} seconds')
-        else:
-            self.timer_qt.stop()
-            duration = int(self.timers[self.timer_index].start()) * 100
-            sound_effect = self.timers[self.timer_index].sound_effect
-            if sound_effect:
-                print(f"Playing sound effect: {sound_effect}")
-                QSound.play(sound_effect)
-            print(f"Switching to timer: {self.timers[self.timer_index].name} with duration: {duration}")
-            self.setStyleSheet(f"background-color: {self.timers[self.timer_index].color};")
-            self.label.setText(f'{self.timers[self.timer_index].name}')
-            self.timer_qt.start(10)
-            self.progress_bar.setMaximum(duration)
-            self.progress_bar.setValue(duration)
-
-            manually_set = False  # Initialize manually_set to False
-            if self.timer_index in self.timer_event_handlers:
-                manually_set = self.timer_event_handlers[self.timer_index](self)
-            if not manually_set:
-                self.timer_index = (self.timer_index + 1) % len(self.timers)  # Go to the next timer
-        
-        
+        planned = self.session.phase_deadline
+        now = time.monotonic()
+        if self.session.poll():
+            self.instrumentation.record('transition_error', now - planned)
+            started = time.perf_counter()
+            self.refresh_display()  # One render, however many transitions were due
+            self.pending_repaint_cost = time.perf_counter() - started  # Qt paints later, see event()
+        if self.session.running:
+            self.phase_timer.start(self.msecs_until_deadline())
+
+    # Qt paints every dirty widget of the window while handling its UpdateRequest, so a transition's
+    # repaint cost is the refresh that queued the changes plus the first paint after it
+    def event(self, event):
+        if event.type() != QEvent.UpdateRequest or self.pending_repaint_cost is None:
+            return super().event(event)
+        started = time.perf_counter()
+        result = super().event(event)
+        self.instrumentation.record('repaint_cost', self.pending_repaint_cost + time.perf_counter() - started)
+        self.pending_repaint_cost = None
+        return result
+
+    # Render a phase change coming from the session
+    def on_transition(self, event):
+        if self.sounds is not None and self.sounds.play(event.sound_effect, event.deadline - event.duration):
+            print(f"Playing sound effect: {event.sound_effect} (mean cue latency {self.sounds.mean_latency() * 1000:.1f} ms)")
+        print(f"Switching to timer: {event.name} with duration: {event.duration}")
+        if self.graph.draw[event.index] >= 0:
+            print(f"Hit count: {event.hit_count}")
+        self.load_sound(self.session.next_timer().sound_effect)  # Have the next cue decoded before it is due
+        self.renderer.set(self, 'setPalette', self.palettes.get(event.color))
+        self.renderer.set(self.label, 'setText', event.label)
+        if self.graph.count[event.index] == self.graph.hits >= 0:
+            self.renderer.set(self.hitcount_label, 'setText', f'Total hits: {event.hit_counter}')
+        self.renderer.set(self.progress_bar, 'setMaximum', event.duration * 100)
+
+    # Queue the transition for the history log, the file is written on a background thread
+    def record_history(self, event):
+        self.history.record('phase', s=self.session.seed, p=event.name, d=event.duration, c=event.hit_count,
+                            h=event.hit_counter - self.last_hit_counter)
+        self.last_hit_counter = event.hit_counter
+
+    # Write the timing histograms next to the presets file
+    def export_timing(self):
+        base = os.path.join(os.path.dirname(presets_file), time.strftime('timing-%Y%m%d-%H%M%S'))
+        self.instrumentation.export_json(base + '.json')
+        self.instrumentation.export_csv(base + '.csv')
+        print(f"Timing exported to {base}.json and {base}.csv")
 
     # Stop Timers
     def stop_timers(self):
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowStaysOnTopHint)  # Clear the window flag
         self.show()
         self.setWindowOpacity(1)
-        self.timer_qt.stop()
-        self.progress_bar.setValue(0)
-        self.label.setText("")
-        self.countdown_label.setText("")
+        self.session.stop()
+        self.history.record('stop', s=self.session.seed, n=self.session.hit_counter)
+        if self.publisher is not None:
+            from broadcast import stop_message
+            self.publisher.publish(stop_message())
+        self.phase_timer.stop()
+        self.display_timer.stop()
+        self.renderer.set(self.progress_bar, 'setValue', 0)
+        self.renderer.set(self.label, 'setText', "")
+        self.renderer.set(self.countdown_label, 'setText', "")
+        self.renderer.set(self, 'setPalette', self.default_palette)
+        self.renderer.flush()
         self.progress_bar.setVisible(False)
-        self.setStyleSheet("")
         self.settings_button.setEnabled(True)
         self.exit_button.setEnabled(True)
         self.start_button.setText('Start')
         self.start_button.clicked.disconnect()
         self.start_button.clicked.connect(self.start_timers)
 
+# One window hosting many independent sessions, e.g. one tile per participant in a group class.
+# All sessions share a single scheduler, one phase timer, one display timer and one sound cache.
+class GroupWindow(QMainWindow):
+    def __init__(self, count, seed=None):
+        super().__init__()
+        self.seed = seed  # Participant i replays seed + i
+        self.presets = PresetStore(presets_store_file)
+        if 'Default' in self.presets:
+            preset = self.presets['Default']
+        else:
+            preset = self.presets[next(iter(self.presets))] if len(self.presets) else DEFAULT_PRESETS['Default']
+        self.timers = default_timers()
+        graph, hit_count_min, hit_count_max = apply_preset(self.timers, preset)
+        check_settings(self.timers, graph.ranges(hit_count_min, hit_count_max))  # Before any window is up
+        self.scheduler = SessionScheduler()
+        self.instrumentation = Instrumentation()
+        self.sounds = None  # QtMultimedia is only loaded on the first Start
+        self.renderer = Renderer()
+        self.default_palette = self.palette()
+        self.palettes = PaletteCache(self.default_palette)
+
+        self.start_button = QPushButton('Start', self)
+        self.start_button.clicked.connect(self.start_timers)
+        self.exit_button = QPushButton('Exit', self)
+        self.exit_button.clicked.connect(QApplication.instance().quit)
+
+        self.phase_timer = QTimer()
+        self.phase_timer.setSingleShot(True)
+        self.phase_timer.setTimerType(Qt.PreciseTimer)
+        self.phase_timer.timeout.connect(self.update_timer)
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(self.refresh_display)
+
+        # Compact tiles, as square a grid as the count allows
+        grid = QGridLayout()
+        columns = math.ceil(math.sqrt(count))
+        self.tiles = []
+        for i in range(count):
+            session = self.scheduler.add(Session(self.timers, hit_count_min, hit_count_max, graph=graph))
+            tile = QLabel()
+            tile.setAlignment(Qt.AlignCenter)
+            tile.setAutoFillBackground(True)
+            grid.addWidget(tile, i // columns, i % columns)
+            session.subscribe(lambda event, tile=tile: self.on_transition(tile, event))
+            self.tiles.append((f'#{i + 1}', session, tile))
+
+        vbox = QVBoxLayout()
+        hbox = QHBoxLayout()
+        hbox.addWidget(self.start_button)
+        hbox.addWidget(self.exit_button)
+        vbox.addLayout(hbox)
+        vbox.addLayout(grid)
+        widget = QWidget()
+        widget.setLayout(vbox)
+        self.setCentralWidget(widget)
+        self.setWindowTitle(f'PTAW - {count} sessions')
+
+    def start_timers(self):
+        self.start_button.setText('Stop')
+        self.start_button.clicked.disconnect()
+        self.start_button.clicked.connect(self.stop_timers)
+        if self.sounds is None:
+            self.sounds = create_sound_cache(self, self.instrumentation, self.timers)
+        for i, (name, session, tile) in enumerate(self.tiles):
+            self.scheduler.start(session, None if self.seed is None else self.seed + i)
+            print(f"Session {name} seed: {session.seed}")
+        self.refresh_display()
+        self.arm_phase_timer()
+        self.display_timer.start(250)
+
+    def stop_timers(self):
+        self.scheduler.stop_all()
+        self.phase_timer.stop()
+        self.display_timer.stop()
+        for name, session, tile in self.tiles:
+            self.renderer.set(tile, 'setText', name)
+            self.renderer.set(tile, 'setPalette', self.default_palette)
+        self.renderer.flush()
+        self.start_button.setText('Start')
+        self.start_button.clicked.disconnect()
+        self.start_button.clicked.connect(self.start_timers)
+
+    # Wait for whichever session is due first
+    def arm_phase_timer(self):
+        deadline = self.scheduler.next_deadline()
+        if deadline is not None:
+            self.phase_timer.start(max(0, math.ceil((deadline - time.monotonic()) * 1000)))
+
+    def update_timer(self):
+        if self.scheduler.poll():
+            self.refresh_display()
+        self.arm_phase_timer()
+
+    def on_transition(self, tile, event):
+        if self.sounds is not None:
+            self.sounds.play(event.sound_effect, event.deadline - event.duration)
+        self.renderer.set(tile, 'setPalette', self.palettes.get(event.color))
+
+    def refresh_display(self):
+        for name, session, tile in self.tiles:
+            self.renderer.set(tile, 'setText', f'{name}\n{session.label}\n{int(session.remaining()) + 1} s')
+        self.renderer.flush()
+        self.display_timer.setInterval(1000 if not self.isVisible() or self.isMinimized() else 250)
+
+
+# Mirror of a publishing App's phase, colour and countdown on another screen.
+# The countdown runs off our own clock, corrected by the Follower's estimate of the publisher's clock.
+class FollowerWindow(QMainWindow):
+    message_received = pyqtSignal(dict)
+
+    def __init__(self, host, port):
+        super().__init__()
+        self.deadline = 0.0
+        self.running = False
+        self.renderer = Renderer()
+        self.default_palette = self.palette()
+        self.palettes = PaletteCache(self.default_palette)
+
+        self.label = QLabel()
+        self.label.setAlignment(Qt.AlignCenter)
+        font = self.label.font()
+        font.setPointSize(28)
+        self.label.setFont(font)
+        self.countdown_label = QLabel()
+        self.countdown_label.setAlignment(Qt.AlignCenter)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setInvertedAppearance(True)
+        self.hitcount_label = QLabel()
+        self.hitcount_label.setAlignment(Qt.AlignCenter)
+
+        vbox = QVBoxLayout()
+        vbox.addWidget(self.label)
+        vbox.addWidget(self.countdown_label)
+        vbox.addWidget(self.progress_bar)
+        vbox.addWidget(self.hitcount_label)
+        widget = QWidget()
+        widget.setLayout(vbox)
+        self.setCentralWidget(widget)
+        self.resize(400, 200)
+        self.setWindowTitle(f'PTAW - following {host}:{port}')
+
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(self.refresh_display)
+        self.display_timer.start(50)
+
+        # Messages arrive on the follower thread, the signal hands them to the Qt thread
+        from broadcast import Follower
+        self.message_received.connect(self.on_message)
+        self.follower = Follower(host, port, self.message_received.emit).start()
+        QApplication.instance().aboutToQuit.connect(self.follower.close)
+
+    def on_message(self, message):
+        if message['k'] == 'phase':
+            self.running = True
+            self.deadline = message['ldl']
+            self.renderer.set(self, 'setPalette', self.palettes.get(message['c']))
+            self.renderer.set(self.label, 'setText', message['l'])
+            self.renderer.set(self.hitcount_label, 'setText', f"Total hits: {message['h']}")
+            self.renderer.set(self.progress_bar, 'setMaximum', message['d'] * 100)
+        elif message['k'] == 'stop':
+            self.running = False
+            self.renderer.set(self, 'setPalette', self.default_palette)
+            self.renderer.set(self.label, 'setText', "")
+        self.refresh_display()
+
+    def refresh_display(self):
+        if self.running:
+            render_countdown(self.renderer, self.progress_bar, self.countdown_label, max(0.0, self.deadline - time.monotonic()))
+        else:
+            self.renderer.set(self.progress_bar, 'setValue', 0)
+            self.renderer.set(self.countdown_label, 'setText', "")
+        self.renderer.flush()
+        self.display_timer.setInterval(1000 if not self.isVisible() or self.isMinimized() else 50)
+
+
+# [HOST:]PORT
+def parse_address(text, default_host):
+    host, _, port = text.rpartition(':')
+    return host or default_host, int(port)
+
+
 def main():
-    app = QApplication(sys.argv)
-    ex = App()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, help='replay the session that printed this seed')
+    parser.add_argument('--sessions', type=int, help='run this many independent sessions side by side in one window')
+    # const is broadcast.DEFAULT_PORT, not imported here to keep startup fast
+    parser.add_argument('--publish', nargs='?', const='47474', metavar='[HOST:]PORT', help='mirror the session to follower displays')
+    parser.add_argument('--follow', metavar='[HOST:]PORT', help='mirror the session of a publishing app')
+    parser.add_argument('--profile-startup', action='store_true', help='print the time spent in each startup phase as JSON and exit')
+    args, qt_args = parser.parse_known_args()
+    profiler = StartupProfiler()
+    profiler.mark('imports')
+    app = QApplication(sys.argv[:1] + qt_args)
+    profiler.mark('qapplication')
+    if args.follow:
+        ex = FollowerWindow(*parse_address(args.follow, '127.0.0.1'))
+    elif args.sessions:
+        ex = GroupWindow(args.sessions, args.seed)
+    else:
+        publisher = None
+        if args.publish:
+            from broadcast import Publisher
+            publisher = Publisher(*parse_address(args.publish, '127.0.0.1')).start()
+        ex = App(args.seed, publisher)
+    profiler.mark('window')
     ex.show()
+    if args.profile_startup:
+        app.processEvents()  # Paint the window
+        profiler.mark('first_paint')
+        if isinstance(ex, App):
+            ex.load_startup_presets()
+            profiler.mark('presets')
+            ex.ensure_sounds()
+            profiler.mark('audio')
+        print(json.dumps(profiler.report(), indent=2))
+        app.quit()
+        return
+    if isinstance(ex, App):
+        QTimer.singleShot(0, ex.load_startup_presets)  # After the first paint
+        QTimer.singleShot(0, ex.ingest_bundled_cues)
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
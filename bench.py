@@ -0,0 +1,364 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from broadcast import Follower, Publisher
+from instrumentation import percentile
+from presets import DEFAULT_PRESETS, PresetStore
+from session import FakeClock, Session, SessionScheduler, default_timers
+
+
+# Hundreds of sessions on one scheduler: CPU time per simulated hour, as a fraction of one core
+def bench_sessions(count=500, hours=1.0):
+    scheduler = SessionScheduler(FakeClock())
+    timers = default_timers()
+    for _ in range(count):
+        scheduler.add(Session(timers, 2, 3))
+    scheduler.start_all()
+    started = time.process_time()
+    transitions = scheduler.fast_forward(hours * 3600)
+    cpu = time.process_time() - started
+    return {
+        'sessions': count,
+        'simulated_seconds': hours * 3600,
+        'transitions': transitions,
+        'cpu_seconds': cpu,
+        'cpu_per_transition_us': cpu / max(1, transitions) * 1e6,
+        'cpu_share': cpu / (hours * 3600),
+    }
+
+
+# End-to-end delay from publish() to a follower's callback over loopback, with dozens of followers.
+# The publisher's clock is skewed as another machine's would be, so 'deadline_error_ms' is how far
+# the corrected deadline lands from where it should be on the follower's clock.
+def bench_broadcast(followers=48, messages=200, skew=1234.5):
+    publisher = Publisher(port=0, clock=lambda: time.monotonic() + skew).start()
+    published = {}
+    results = []
+    lock = threading.Lock()
+    received = threading.Semaphore(0)
+
+    def on_message(message):
+        now = time.monotonic()
+        with lock:
+            results.append((now - published[message['h']], abs(message['ldl'] - published[message['h']] - 5)))
+        received.release()
+
+    clients = [Follower('127.0.0.1', publisher.port, on_message).start() for _ in range(followers)]
+    for client in clients:
+        client.connected.wait(5)
+    time.sleep(0.3)  # Let the clock sync pings settle
+    for i in range(messages):
+        published[i] = time.monotonic()
+        publisher.publish({'k': 'phase', 'i': i % 5, 'n': 'Hit', 'c': '#000000', 'l': 'Hit', 'd': 5,
+                           'dl': published[i] + skew + 5, 'h': i})
+        for _ in range(followers):
+            received.acquire(timeout=5)
+    for client in clients:
+        client.close()
+    publisher.close()
+    latencies = sorted(latency * 1000 for latency, error in results)
+    errors = sorted(error * 1000 for latency, error in results)
+    return {
+        'followers': followers,
+        'messages': messages,
+        'delivered': len(latencies),
+        'latency_ms': {'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99), 'max': latencies[-1] if latencies else 0.0},
+        'deadline_error_ms': {'p50': percentile(errors, 50), 'p99': percentile(errors, 99), 'max': errors[-1] if errors else 0.0},
+    }
+
+
+# Time to first window of `app.py --profile-startup` under Qt's offscreen platform, median of several runs
+def bench_startup(runs=5):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    reports = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, app_path, '--profile-startup'], env=env, capture_output=True,
+                                text=True, check=True).stdout
+        reports.append(json.loads(output[output.index('{'):]))
+    first_window = [sum(report['phases_ms'][phase] for phase in ('imports', 'qapplication', 'window', 'first_paint'))
+                    for report in reports]
+    return {
+        'runs': runs,
+        'time_to_first_window_ms': statistics.median(first_window),
+        'phases_ms': {phase: statistics.median(report['phases_ms'][phase] for report in reports)
+                      for phase in reports[0]['phases_ms']},
+    }
+
+
+# p50, p99 and max of durations in seconds, in microseconds
+def timing_us(durations):
+    values = sorted(duration * 1e6 for duration in durations)
+    return {'p50': percentile(values, 50), 'p99': percentile(values, 99), 'max': values[-1] if values else 0.0}
+
+
+# Resident set size in MB, from /proc on Linux and the peak from getrusage elsewhere
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+# The app module on Qt's offscreen platform, with presets and history in a throwaway directory.
+# app.py resolves its config directory on import, so this has to run before anything imports it.
+def load_app():
+    if 'app' not in sys.modules:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        config_directory = tempfile.mkdtemp(prefix='ptaw-bench-')
+        os.environ['XDG_CONFIG_HOME'] = config_directory
+        os.environ['APPDATA'] = config_directory
+    import app
+    from PyQt5.QtWidgets import QApplication
+    if QApplication.instance() is None:
+        app.qapplication = QApplication(sys.argv[:1])  # Kept alive for every benchmark
+    return app
+
+
+# A shown App whose session runs on a FakeClock, so benchmarks decide when time moves.
+# The app prints on every transition, that goes to devnull while benchmarks run.
+def start_app(app, phase_seconds=None, seed=1):
+    window = app.App(seed=seed)
+    window.show()
+    window.load_startup_presets()
+    if phase_seconds is not None:
+        for timer in window.timers:
+            timer.min_time = timer.max_time = phase_seconds
+    window.session.clock = FakeClock(time.monotonic())
+    window.start_timers()
+    window.phase_timer.stop()  # Ticks and transitions are driven by the benchmark instead
+    window.display_timer.stop()
+    return window
+
+
+def close_app(window):
+    window.stop_timers()
+    window.history.close()
+    window.close()
+    window.deleteLater()
+
+
+# Cost of one display tick (refresh plus the repaint it causes) at the 50 ms display rate
+def bench_tick(ticks=2000):
+    app = load_app()
+    from PyQt5.QtWidgets import QApplication
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        window = start_app(app, phase_seconds=3600)  # No transitions, only countdown and progress updates
+        durations = []
+        for _ in range(ticks):
+            window.session.clock.advance(0.05)
+            started = time.perf_counter()
+            window.display_tick()
+            QApplication.processEvents()
+            durations.append(time.perf_counter() - started)
+        close_app(window)
+    return {'ticks': ticks, 'tick_us': timing_us(durations)}
+
+
+# Cost of one phase change: new palette, labels and cue trigger plus the repaint they cause
+def bench_transition(transitions=500):
+    app = load_app()
+    from PyQt5.QtWidgets import QApplication
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        window = start_app(app, phase_seconds=1)
+        durations = []
+        for _ in range(transitions):
+            window.session.clock.now = window.session.phase_deadline
+            started = time.perf_counter()
+            window.update_timer()
+            QApplication.processEvents()
+            durations.append(time.perf_counter() - started)
+        sound = window.sounds is not None
+        close_app(window)
+    return {'transitions': transitions, 'sound': sound, 'transition_us': timing_us(durations)}
+
+
+# A store of n presets in directory, each one a copy of one of the built-in presets
+def make_store(directory, n):
+    store = PresetStore(os.path.join(directory, f'presets-{n}.db'))
+    presets = list(DEFAULT_PRESETS.values())
+    store.update({f'Preset {i:05d}': presets[i % len(presets)] for i in range(n)})
+    return store
+
+
+# Opening the store (load_presets), loading one preset and saving one preset at several store sizes
+def bench_presets(sizes=(10, 1000, 10000), repeats=50):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            make_store(directory, n).close()
+            path = os.path.join(directory, f'presets-{n}.db')
+            opens, loads, saves = [], [], []
+            for i in range(repeats):
+                started = time.perf_counter()
+                store = PresetStore(path)
+                opens.append(time.perf_counter() - started)
+                name = f'Preset {random.randrange(n):05d}'
+                started = time.perf_counter()
+                preset = store[name]
+                loads.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                store[f'Saved {i}'] = preset
+                saves.append(time.perf_counter() - started)
+                store.close()
+            results[str(n)] = {'open_us': timing_us(opens), 'load_us': timing_us(loads), 'save_us': timing_us(saves)}
+    return results
+
+
+# Opening Settings for the first time and reopening the reused dialog, at several store sizes
+def bench_settings(sizes=(10, 1000, 10000), repeats=20):
+    app = load_app()
+    from PyQt5.QtWidgets import QApplication
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for n in sizes:
+            window = app.App()
+            window.show()
+            window.presets = make_store(directory, n)
+            first, reopen = [], []
+            for i in range(repeats):
+                started = time.perf_counter()
+                window.open_settings()
+                QApplication.processEvents()
+                (first if i < repeats // 2 else reopen).append(time.perf_counter() - started)
+                window.settings_window.close()
+                if i < repeats // 2 - 1:  # Build a new dialog next time, the second half reuses it
+                    window.settings_window.deleteLater()
+                    window.settings_window = None
+                QApplication.processEvents()
+            results[str(n)] = {'first_open_us': timing_us(first), 'reopen_us': timing_us(reopen)}
+            window.settings_window.deleteLater()
+            window.presets.close()
+            window.history.close()
+            window.close()
+            window.deleteLater()
+    return results
+
+
+# Hours of a session in accelerated time: display ticks once a simulated second and every transition
+# woken up to 5 ms late, as a real timer would. Tracks RSS, tick cost and whether deadlines drift
+# away from the sum of the phase durations.
+def bench_soak(hours=4.0, tick_seconds=1.0, samples=8):
+    app = load_app()
+    from PyQt5.QtWidgets import QApplication
+    rng = random.Random(1)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        window = start_app(app)
+        clock = window.session.clock
+        durations = [window.session.phase_duration]  # The first phase started with the session
+        window.session.subscribe(lambda event: durations.append(event.duration))
+        session_start = window.session.phase_deadline - window.session.phase_duration
+        end = clock.now + hours * 3600
+        sample_every = hours * 3600 / samples
+        next_sample = clock.now + sample_every  # The first interval doubles as warm-up
+        tick_costs = []
+        report = []
+        started = time.perf_counter()
+        while clock.now < end:
+            next_tick = clock.now + tick_seconds
+            while window.session.phase_deadline <= next_tick:
+                clock.now = window.session.phase_deadline + rng.uniform(0, 0.005)
+                window.update_timer()
+            clock.now = next_tick
+            tick_started = time.perf_counter()
+            window.display_tick()
+            QApplication.processEvents()
+            tick_costs.append(time.perf_counter() - tick_started)
+            if clock.now >= next_sample:
+                drift = window.session.phase_deadline - window.session.phase_duration - session_start - sum(durations[:-1])
+                report.append({'simulated_hours': round(hours - (end - clock.now) / 3600, 3), 'rss_mb': rss_mb(),
+                               'tick_p50_us': timing_us(tick_costs)['p50'], 'drift_ms': drift * 1000})
+                tick_costs = []
+                next_sample += sample_every
+        wall = time.perf_counter() - started
+        close_app(window)
+    return {
+        'simulated_hours': hours,
+        'wall_seconds': wall,
+        'transitions': len(durations),
+        # Over the second half only, the first hours include caches and ring buffers filling up
+        'rss_growth_mb': report[-1]['rss_mb'] - report[len(report) // 2]['rss_mb'],
+        'tick_growth_us': report[-1]['tick_p50_us'] - report[len(report) // 2]['tick_p50_us'],
+        'drift_ms': max(abs(sample['drift_ms']) for sample in report),
+        'samples': report,
+    }
+
+
+BENCHMARKS = {
+    'sessions': bench_sessions,
+    'broadcast': bench_broadcast,
+    'startup': bench_startup,
+    'tick': bench_tick,
+    'transition': bench_transition,
+    'presets': bench_presets,
+    'settings': bench_settings,
+    'soak': bench_soak,
+}
+
+
+# Timings, costs and growth where the current run is worse than the baseline by more than tolerance
+# (a fraction), plus slack so that microsecond noise on tiny values isn't reported.
+# Only keys ending in a unit of cost are compared, counts and settings aren't, and neither are the
+# tails, which vary too much between runs on a shared machine to gate on.
+def regressions(results, baseline, tolerance=0.25, path=()):
+    found = []
+    for key, value in results.items():
+        if key not in baseline or key in NOISY:
+            continue
+        if isinstance(value, dict):
+            found += regressions(value, baseline[key], tolerance, path + (key,))
+            continue
+        cost = any(part.endswith(COST_UNITS) for part in path + (key,))
+        if not cost or not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        slack = SLACK[next(unit for unit in COST_UNITS if any(part.endswith(unit) for part in path + (key,)))]
+        if value > baseline[key] * (1 + tolerance) + slack:
+            found.append({'metric': '.'.join(path + (key,)), 'baseline': baseline[key], 'value': value})
+    return found
+
+
+COST_UNITS = ('_us', '_ms', '_mb', '_share')
+NOISY = ('p99', 'max', 'samples')
+SLACK = {'_us': 20.0, '_ms': 1.0, '_mb': 1.0, '_share': 0.001}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Timer app benchmarks, results are printed as JSON')
+    parser.add_argument('benchmarks', nargs='*', help=f'any of {", ".join(BENCHMARKS)}, all of them by default')
+    parser.add_argument('-o', '--output', help='also write the results to this file, e.g. to use as a baseline')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against, exits with 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline, 0.25 by default')
+    args = parser.parse_args()
+    names = args.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+    results = {name: BENCHMARKS[name]() for name in names}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"Regression in {regression['metric']}: {regression['value']:.3f} against {regression['baseline']:.3f}",
+                  file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import collections
+import json
+import threading
+import time
+
+DEFAULT_PORT = 47474
+
+
+# Compact message for a session transition, deadlines are on the publisher's monotonic clock
+def transition_message(event):
+    return {'k': 'phase', 'i': event.index, 'n': event.name, 'c': event.color, 'l': event.label,
+            'd': event.duration, 'dl': event.deadline, 'h': event.hit_counter}
+
+
+def stop_message():
+    return {'k': 'stop'}
+
+
+def encode(message, clock=time.monotonic):
+    message['t'] = clock()
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+# Pushes session messages to every connected follower over TCP.
+# The asyncio loop runs on its own thread, publish() can be called from the Qt thread.
+# clock must be the one the published deadlines are on.
+class Publisher:
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, max_buffer=65536, clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.clock = clock
+        self.max_buffer = max_buffer  # Followers that fall this far behind are dropped
+        self.loop = asyncio.new_event_loop()
+        self.writers = set()
+        self.state = None  # Last message, sent to followers as they connect
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.server = self.loop.run_until_complete(asyncio.start_server(self.on_connect, self.host, self.port))
+                self.port = self.server.sockets[0].getsockname()[1]  # Resolve port 0
+            except OSError as e:
+                errors.append(e)
+                return
+            finally:
+                ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name='Publisher', daemon=True)
+        self.thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    async def on_connect(self, reader, writer):
+        self.writers.add(writer)
+        if self.state is not None:
+            writer.write(encode(dict(self.state), self.clock))
+        try:
+            async for line in reader:  # Followers only send clock sync pings
+                message = json.loads(line)
+                if message.get('k') == 'ping':
+                    writer.write(encode({'k': 'pong', 't0': message['t0']}, self.clock))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def publish(self, message):
+        self.loop.call_soon_threadsafe(self.broadcast, message)
+
+    def broadcast(self, message):
+        self.state = message
+        data = encode(dict(message), self.clock)  # Encoded once for every follower
+        for writer in list(self.writers):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.writers.discard(writer)
+                writer.close()
+            else:
+                writer.write(data)
+
+    def close(self):
+        if self.thread is None:
+            return
+
+        async def shutdown():
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+
+
+# Receives a publisher's messages and corrects for the difference between the two monotonic clocks.
+# The offset comes from ping/pong round trips, taking the sample with the shortest round trip among
+# the last few pings, so the offset follows the clocks as they drift apart.
+# on_message is called on the follower's own thread with 'ldl' (the deadline on our clock) and
+# 'latency' (estimated one-way delay) added to phase messages.
+class Follower:
+    def __init__(self, host, port, on_message, ping_interval=10.0, window=8):
+        self.host = host
+        self.port = port
+        self.on_message = on_message
+        self.ping_interval = ping_interval
+        self.offset = None  # Publisher clock minus ours
+        self.samples = collections.deque(maxlen=window)  # (round trip, offset) of recent pings
+        self.loop = asyncio.new_event_loop()
+        self.connected = threading.Event()
+        self.closed = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.main, name='Follower', daemon=True)
+        self.thread.start()
+        return self
+
+    def main(self):
+        try:
+            self.loop.run_until_complete(self.run())
+        except asyncio.CancelledError:
+            pass
+
+    async def run(self):
+        while not self.closed:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(1)  # Publisher not up yet, keep trying
+                continue
+            self.samples.clear()  # Round trips over an old connection say nothing about this one
+            self.connected.set()
+            pinger = asyncio.ensure_future(self.ping(writer))
+            try:
+                async for line in reader:
+                    self.handle(json.loads(line))
+            except (ConnectionError, ValueError):
+                pass
+            finally:
+                pinger.cancel()
+                writer.close()
+                self.connected.clear()
+
+    async def ping(self, writer):
+        for _ in range(4):  # A quick burst for a good first estimate
+            writer.write((json.dumps({'k': 'ping', 't0': time.monotonic()}) + '\n').encode())
+            await asyncio.sleep(0.05)
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            writer.write((json.dumps({'k': 'ping', 't0': time.monotonic()}) + '\n').encode())
+
+    def handle(self, message):
+        now = time.monotonic()
+        if message['k'] == 'pong':
+            self.samples.append((now - message['t0'], message['t'] - (message['t0'] + now) / 2))
+            self.offset = min(self.samples)[1]
+            return
+        if self.offset is None:
+            self.offset = message['t'] - now  # No round trip yet, assume no delay
+        if 'dl' in message:
+            message['ldl'] = message['dl'] - self.offset
+        message['latency'] = now - (message['t'] - self.offset)
+        self.on_message(message)
+
+    def cancel(self):
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+
+    def close(self):
+        self.closed = True
+        self.loop.call_soon_threadsafe(self.cancel)
+        self.thread.join(2)
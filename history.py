@@ -0,0 +1,121 @@
+import datetime
+import json
+import os
+import threading
+import time
+import zlib
+
+
+# Append-only session history, one file per month. Each record is a line of compact JSON
+# prefixed with its CRC32, so a record torn by a crash is recognised and skipped by the reader.
+# record() only appends to an in-memory batch, a background thread does all the file writing.
+class SessionHistory:
+    def __init__(self, directory, flush_interval=1.0, batch_size=256):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.batch = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.checked = set()  # Files whose tail has been checked for a torn record
+        os.makedirs(directory, exist_ok=True)
+        self.writer = threading.Thread(target=self.run, name='SessionHistory', daemon=True)
+        self.writer.start()
+
+    # Queue a record, kind is e.g. 'start', 'phase' or 'stop'
+    def record(self, kind, **fields):
+        fields['k'] = kind
+        fields['t'] = round(time.time(), 3)
+        with self.lock:
+            self.batch.append(fields)
+            full = len(self.batch) >= self.batch_size
+        if full:
+            self.wake.set()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch, self.batch = self.batch, []
+        if not batch:
+            return
+        files = {}
+        for record in batch:
+            line = json.dumps(record, separators=(',', ':'))
+            month = time.strftime('%Y-%m', time.localtime(record['t']))
+            files.setdefault(month, []).append(f'{zlib.crc32(line.encode()):08x} {line}\n')
+        for month, lines in files.items():
+            path = os.path.join(self.directory, f'history-{month}.log')
+            with open(path, 'ab') as f:
+                if path not in self.checked:
+                    if f.tell() > 0 and not self.ends_with_newline(path):
+                        f.write(b'\n')  # The previous run died mid-record, start on a fresh line
+                    self.checked.add(path)
+                f.write(''.join(lines).encode())
+                f.flush()
+                os.fsync(f.fileno())
+
+    def ends_with_newline(self, path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    # Stop the writer and write whatever is still queued
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+        self.flush()
+
+
+# Records from the monthly files between two dates (inclusive), oldest first, torn records skipped
+def read_records(directory, since=None, until=None):
+    if not os.path.isdir(directory):
+        return
+    first = since.strftime('%Y-%m') if since else ''
+    last = until.strftime('%Y-%m') if until else '9999-99'
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('history-') and name.endswith('.log')) or not first <= name[8:15] <= last:
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            for raw in f:
+                if len(raw) < 10 or not raw.endswith(b'\n'):
+                    continue
+                line = raw[9:-1]
+                try:
+                    if int(raw[:8], 16) != zlib.crc32(line):
+                        continue
+                except ValueError:
+                    continue
+                record = json.loads(line)
+                if since is not None or until is not None:
+                    day = datetime.date.fromtimestamp(record['t'])
+                    if (since is not None and day < since) or (until is not None and day > until):
+                        continue
+                yield record
+
+
+# Per-day totals of sessions started, hits and seconds spent in phases
+def daily_totals(directory, since=None, until=None):
+    totals = {}
+    days = {}  # Quarter hour -> date, local midnight always falls on a quarter hour
+    for record in read_records(directory, since, until):
+        quarter = int(record['t'] // 900)
+        if quarter not in days:
+            days[quarter] = datetime.date.fromtimestamp(quarter * 900).isoformat()
+        day = days[quarter]
+        if day not in totals:
+            totals[day] = {'sessions': 0, 'hits': 0, 'seconds': 0}
+        if record['k'] == 'start':
+            totals[day]['sessions'] += 1
+        elif record['k'] == 'phase':
+            totals[day]['seconds'] += record['d']
+            totals[day]['hits'] += record['h']
+    return totals
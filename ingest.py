@@ -0,0 +1,213 @@
+import hashlib
+import io
+import math
+import os
+import struct
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+# Every processed cue is 16-bit stereo at this rate, so playback never has to convert anything
+OUTPUT_RATE = 44100
+OUTPUT_CHANNELS = 2
+MAX_SECONDS = 30  # Longer files are almost certainly the wrong file
+MAX_CHANNELS = 8
+MAX_FORMAT_SIZE = 1024  # Format chunks are 16 to 40 bytes, a bigger one is corrupt
+SILENCE = 10 ** (-50 / 20)  # -50 dBFS, quieter leading samples are trimmed
+TARGET_RMS = 10 ** (-20 / 20)  # Loudness target, -20 dBFS RMS
+MAX_PEAK = 10 ** (-1 / 20)  # Never louder than -1 dBFS peak
+RESAMPLE_ZEROS = 16  # Sinc zero crossings on each side of a resampled sample, more is sharper and slower
+RESAMPLE_CUTOFF = 0.95  # Of the lower Nyquist frequency, leaves the filter room to roll off before it
+RESAMPLE_BETA = 8.6  # Kaiser window shape, about 80 dB of stopband attenuation
+RESAMPLE_BLOCK = 4096  # Output frames computed at once, bounds the memory the filter taps take
+PROCESSING_VERSION = b'2'  # Bump when the processing changes, so cached cues are redone
+HASH_BLOCK = 1 << 20
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE  # The real format is the first two bytes of the subformat GUID
+
+
+class IngestError(Exception):
+    pass
+
+
+# Encoding, channels, bytes per sample, rate and size of the audio data from a WAV header,
+# leaving f at the start of the audio data. Reads PCM and float files, plain or WAVE_FORMAT_EXTENSIBLE,
+# which the wave module rejects.
+def read_header(f, path):
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:] != b'WAVE':
+        raise IngestError(f'{path} is not a valid WAV file')
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise IngestError(f'{path} has no audio' if fmt else f'{path} is not a valid WAV file: no format chunk')
+        chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        if chunk_id == b'data' and fmt is not None:
+            break
+        if chunk_id == b'fmt ':
+            if size > MAX_FORMAT_SIZE:
+                raise IngestError(f'{path} is not a valid WAV file: {size} byte format chunk')
+            fmt = f.read(size + size % 2)  # Chunks are padded to an even size
+        else:
+            f.seek(size + size % 2, io.SEEK_CUR)  # Skipped without reading, metadata chunks can be any size
+    if len(fmt) < 16:
+        raise IngestError(f'{path} is not a valid WAV file: truncated format chunk')
+    encoding, channels, rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if encoding == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        encoding = struct.unpack('<H', fmt[24:26])[0]
+    if encoding not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise IngestError(f'{path} uses an unsupported encoding (format {encoding}), only PCM and float WAV files can be used')
+    if not 1 <= channels <= MAX_CHANNELS:
+        raise IngestError(f'{path} has {channels} channels')
+    if rate <= 0 or block_align < channels or bits <= 0:
+        raise IngestError(f'{path} is not a valid WAV file: {rate} Hz, {bits} bits, {block_align} bytes per frame')
+    return encoding, channels, block_align // channels, rate, size
+
+
+def check_length(frames, rate, path):
+    if frames == 0:
+        raise IngestError(f'{path} has no audio')
+    if frames / rate > MAX_SECONDS:
+        raise IngestError(f'{path} is {frames / rate:.0f} seconds long, cues can be at most {MAX_SECONDS}')
+
+
+# Samples as float32 frames and the rate of the WAV file open as f
+def decode(f, path):
+    import numpy as np
+
+    encoding, channels, width, rate, size = read_header(f, path)
+    raw = f.read(size)  # A truncated file just has less audio
+    frames = len(raw) // (width * channels)
+    check_length(frames, rate, path)
+
+    raw = raw[:frames * width * channels]  # Drop a truncated last frame
+    if encoding == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+        samples = np.nan_to_num(np.frombuffer(raw, f'<f{width}').astype(np.float32))
+    elif encoding == WAVE_FORMAT_IEEE_FLOAT:
+        raise IngestError(f'{path} uses an unsupported float width of {width} bytes')
+    elif width == 1:
+        samples = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, '<i2').astype(np.float32) / 2 ** 15
+    elif width == 3:
+        bytes_ = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((bytes_[:, 0] | bytes_[:, 1] << 8 | bytes_[:, 2] << 16) << 8 >> 8).astype(np.float32) / 2 ** 23
+    elif width == 4:
+        samples = np.frombuffer(raw, '<i4').astype(np.float32) / 2 ** 31
+    else:
+        raise IngestError(f'{path} uses an unsupported sample width of {width} bytes')
+    return samples.reshape(-1, channels), rate
+
+
+# Band-limited resampling to OUTPUT_RATE with a Kaiser windowed sinc. The filter cuts off below the lower of the
+# two Nyquist frequencies, so downsampling doesn't fold everything above the new Nyquist back down as aliases.
+def resample(samples, rate):
+    import numpy as np
+
+    # Output frame n sits at n * step / phases input frames
+    gcd = math.gcd(OUTPUT_RATE, rate)
+    phases, step = OUTPUT_RATE // gcd, rate // gcd
+    cutoff = RESAMPLE_CUTOFF * min(1, OUTPUT_RATE / rate)  # Of the input Nyquist frequency
+    half_width = int(RESAMPLE_ZEROS / cutoff) + 1  # In input frames
+    taps = np.arange(-half_width + 1, half_width + 1)
+
+    def filters(phase):
+        offsets = phase[:, None] / phases - taps
+        window = np.i0(RESAMPLE_BETA * np.sqrt(np.clip(1 - (offsets / half_width) ** 2, 0, 1))) / np.i0(RESAMPLE_BETA)
+        return (cutoff * np.sinc(cutoff * offsets) * window).astype(np.float32)
+
+    # Common rates only have a few hundred phases, their filters are worked out once
+    table = filters(np.arange(phases)) if phases <= RESAMPLE_BLOCK else None
+    padded = np.pad(samples, ((half_width, half_width), (0, 0)))
+    output = np.empty((len(samples) * phases // step, samples.shape[1]), np.float32)
+    for start in range(0, len(output), RESAMPLE_BLOCK):
+        positions = np.arange(start, min(start + RESAMPLE_BLOCK, len(output))) * step
+        weights = filters(positions % phases) if table is None else table[positions % phases]
+        indices = (positions // phases)[:, None] + taps + half_width
+        output[start:start + len(positions)] = np.einsum('ft,ftc->fc', weights, padded[indices])
+    return output
+
+
+def process(samples, rate):
+    import numpy as np
+
+    # Stereo output, anything that isn't mono or stereo is mixed down first
+    if samples.shape[1] > 2:
+        samples = samples.mean(axis=1, keepdims=True)
+    if samples.shape[1] == 1:
+        samples = np.repeat(samples, 2, axis=1)
+
+    if rate != OUTPUT_RATE:
+        samples = resample(samples, rate)
+
+    # Trim leading silence, keeping 5 ms so the attack isn't clipped
+    loud = np.nonzero(np.abs(samples).max(axis=1) > SILENCE)[0]
+    if len(loud) == 0:
+        raise IngestError('the file is silent')
+    samples = samples[max(0, loud[0] - OUTPUT_RATE // 200):]
+
+    rms = float(np.sqrt(np.mean(samples ** 2)))
+    peak = float(np.abs(samples).max())
+    samples = samples * min(TARGET_RMS / rms, MAX_PEAK / peak)
+    return (np.clip(samples, -1, 1) * (2 ** 15 - 1)).astype('<i2')
+
+
+# Validate, convert and normalise a cue once, returns the path of the processed copy in cache_directory.
+# Copies are named after the hash of the original's content, so the same file is only ever processed once.
+def ingest(path, cache_directory):
+    try:
+        with open(path, 'rb') as f:
+            # Judge the length from the header first, so a huge file is refused without being read
+            encoding, channels, width, rate, size = read_header(f, path)
+            end = f.tell() + min(size, os.fstat(f.fileno()).st_size - f.tell())
+            check_length((end - f.tell()) // (width * channels), rate, path)
+            f.seek(0)
+            digest = hashlib.sha256(PROCESSING_VERSION)
+            while f.tell() < end:  # Hashed in blocks, anything after the audio data is left out
+                digest.update(f.read(min(HASH_BLOCK, end - f.tell())))
+            output_path = os.path.join(cache_directory, f'{digest.hexdigest()}.wav')
+            if os.path.exists(output_path):
+                return output_path
+            f.seek(0)
+            samples, rate = decode(f, path)
+    except OSError as e:
+        raise IngestError(f'{path} could not be read: {e}')
+    try:
+        pcm = process(samples, rate)
+    except IngestError as e:
+        raise IngestError(f'{path}: {e}')
+    os.makedirs(cache_directory, exist_ok=True)
+    temp_path = f'{output_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with wave.open(temp_path, 'wb') as f:
+        f.setnchannels(OUTPUT_CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(OUTPUT_RATE)
+        f.writeframes(pcm.tobytes())
+    os.replace(temp_path, output_path)  # Never leave a half-written cue behind under the final name
+    return output_path
+
+
+# Length of a WAV file in seconds, None if it can't be read
+def duration(path):
+    try:
+        with open(path, 'rb') as f:
+            encoding, channels, width, rate, size = read_header(f, path)
+            size = min(size, os.fstat(f.fileno()).st_size - f.tell())
+    except (OSError, IngestError):
+        return None
+    return size // (width * channels) / rate
+
+
+# Runs ingest() on a small thread pool, so selecting a file never blocks the UI
+class CueIngester:
+    def __init__(self, cache_directory, workers=2):
+        self.cache_directory = cache_directory
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='CueIngester')
+
+    def submit(self, path):
+        return self.executor.submit(ingest, path, self.cache_directory)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
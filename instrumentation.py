@@ -0,0 +1,90 @@
+import csv
+import json
+import math
+from array import array
+
+METRICS = ('transition_error', 'tick_jitter', 'sound_delay', 'repaint_cost')
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# Fixed-size buffer of floats, the oldest samples are overwritten once it is full
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = array('d', bytes(8 * capacity))
+        self.count = 0  # Total samples ever appended
+
+    def append(self, value):
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def samples(self):
+        if self.count <= self.capacity:
+            return self.values[:self.count]
+        start = self.count % self.capacity
+        return self.values[start:] + self.values[:start]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * p / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def histogram(sorted_values, bins):
+    if not sorted_values:
+        return []
+    low, high = sorted_values[0], sorted_values[-1]
+    width = (high - low) / bins or 1.0
+    counts = [0] * bins
+    for value in sorted_values:
+        counts[min(int((value - low) / width), bins - 1)] += 1
+    return [(low + i * width, low + (i + 1) * width, count) for i, count in enumerate(counts)]
+
+
+# Timing telemetry, all samples are seconds and cheap enough to record on every transition and tick
+class Instrumentation:
+    def __init__(self, capacity=4096):
+        self.buffers = {name: RingBuffer(capacity) for name in METRICS}
+
+    def record(self, metric, seconds):
+        self.buffers[metric].append(seconds)
+
+    # Percentiles and histogram per metric, in milliseconds
+    def summary(self, bins=20):
+        result = {}
+        for name, buffer in self.buffers.items():
+            values = sorted(value * 1000 for value in buffer.samples())
+            result[name] = {
+                'count': buffer.count,
+                'samples': len(values),
+                'min': values[0] if values else 0.0,
+                'mean': sum(values) / len(values) if values else 0.0,
+                'max': values[-1] if values else 0.0,
+                'percentiles': {f'p{p:g}': percentile(values, p) for p in PERCENTILES},
+                'histogram': [{'start': start, 'end': end, 'count': count}
+                              for start, end, count in histogram(values, bins)],
+            }
+        return result
+
+    def export_json(self, path, bins=20):
+        with open(path, 'w') as f:
+            json.dump({'unit': 'ms', 'metrics': self.summary(bins)}, f, indent=2)
+
+    def export_csv(self, path, bins=20):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['metric', 'statistic', 'start_ms', 'end_ms', 'value'])
+            for name, stats in self.summary(bins).items():
+                for key in ('count', 'samples', 'min', 'mean', 'max'):
+                    writer.writerow([name, key, '', '', stats[key]])
+                for key, value in stats['percentiles'].items():
+                    writer.writerow([name, key, '', '', value])
+                for row in stats['histogram']:
+                    writer.writerow([name, 'bin', row['start'], row['end'], row['count']])
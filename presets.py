@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+
+DEFAULT_PRESETS = {
+    'Default': [(120, 240, "rgba(24, 40, 84,1)"), (10, 10, "rgba(34, 156, 23,1)"), (5, 15, "rgba(173, 5, 39,1)"), (10, 20, "rgba(81, 2, 156,1)"), (5, 5, "rgba(4, 51, 181,1)"), ('Hit count', 1, 3)],
+    'Short and Hard': [(120, 240, "rgba(24, 40, 84,1)"), (10, 10, "rgba(34, 156, 23,1)"), (5, 15, "rgba(173, 5, 39,1)"), (10, 20, "rgba(81, 2, 156,1)"), (5, 5, "rgba(4, 51, 181,1)"), ('Hit count', 1, 3)],
+    'Long Endurance': [(300, 600, "rgba(24, 40, 84,1)"), (9, 9, "rgba(34, 156, 23,1)"), (10, 10, "rgba(173, 5, 39,1)"), (11, 11, "rgba(81, 2, 156,1)"), (5, 5, "rgba(4, 51, 181,1)"), ('Hit count', 2, 4)],
+}
+
+
+# Presets keyed by name in an SQLite file next to presets.json.
+# Every change is its own journaled transaction touching a single row, and a lookup by name
+# goes through the primary key index, so neither depends on how big the library is.
+# Presets keep the list-of-tuples format, read back as lists just like json.load gave us.
+class PresetStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)  # Create the directory if it does not exist
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA synchronous=FULL')  # fsync every commit
+        # The table and its first presets are created in one transaction, so a crash or a failed
+        # migration never leaves an empty library behind, and an empty one is filled again next time
+        with self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS presets (name TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            if len(self) == 0:
+                self.insert(self.initial_presets())
+
+    # The old single-file library if there is one, which is left in place as a backup, else the built-in presets.
+    # A presets.json that can't be read gives nothing, so the migration is tried again on the next start.
+    def initial_presets(self):
+        legacy_file = os.path.join(os.path.dirname(self.path), 'presets.json')
+        if not os.path.exists(legacy_file):
+            return DEFAULT_PRESETS
+        try:
+            with open(legacy_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Presets not migrated from {legacy_file}: {e}")
+            return {}
+
+    def __contains__(self, name):
+        return self.connection.execute('SELECT 1 FROM presets WHERE name = ?', (name,)).fetchone() is not None
+
+    def __getitem__(self, name):
+        row = self.connection.execute('SELECT data FROM presets WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return json.loads(row[0])
+
+    def __setitem__(self, name, preset):
+        with self.connection:
+            self.connection.execute('INSERT INTO presets (name, data) VALUES (?, ?) '
+                                    'ON CONFLICT(name) DO UPDATE SET data = excluded.data',
+                                    (name, json.dumps(preset)))
+
+    def __delitem__(self, name):
+        with self.connection:
+            if self.connection.execute('DELETE FROM presets WHERE name = ?', (name,)).rowcount == 0:
+                raise KeyError(name)
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM presets').fetchone()[0]
+
+    # Names in the order they were first saved
+    def __iter__(self):
+        return iter(self.names())
+
+    def keys(self):
+        return self.names()
+
+    def names(self, offset=0, limit=-1):
+        rows = self.connection.execute('SELECT name FROM presets ORDER BY rowid LIMIT ? OFFSET ?', (limit, offset))
+        return [row[0] for row in rows]
+
+    # Names containing text (case-insensitive), for type-ahead
+    def search(self, text, limit=50):
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        rows = self.connection.execute("SELECT name FROM presets WHERE name LIKE ? ESCAPE '\\' ORDER BY rowid LIMIT ?",
+                                       (pattern, limit))
+        return [row[0] for row in rows]
+
+    # Save many presets in a single transaction
+    def update(self, presets):
+        with self.connection:
+            self.insert(presets)
+
+    def insert(self, presets):
+        self.connection.executemany('INSERT INTO presets (name, data) VALUES (?, ?) '
+                                    'ON CONFLICT(name) DO UPDATE SET data = excluded.data',
+                                    [(name, json.dumps(preset)) for name, preset in presets.items()])
+
+    def import_json(self, path):
+        with open(path, 'r') as f:
+            self.update(json.load(f))
+
+    # Write the whole library in the old presets.json format, via a temp file so a crash never leaves half a file
+    def export_json(self, path):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write('{')
+            rows = self.connection.execute('SELECT name, data FROM presets ORDER BY rowid')
+            for i, (name, data) in enumerate(rows):
+                f.write(f'{", " if i else ""}{json.dumps(name)}: {data}')
+            f.write('}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,417 @@
+import heapq
+import itertools
+import os
+import random
+import time
+from array import array
+
+current_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+class Timer:
+    def __init__(self, name, min_time, max_time, color, sound_effect):
+        self.name = name
+        self.min_time = min_time
+        self.max_time = max_time
+        self.color = color
+        self.sound_effect = os.path.join(current_dir, sound_effect)
+
+    def start(self, rng=random):
+        return rng.uniform(self.min_time, self.max_time)
+
+
+# The built-in program. Every phase can draw a new target for a counter, count towards one and
+# either go on to a fixed next phase or loop back until a counter reaches its target.
+# Labels are format strings with {name}, {count} and {target} of the phase's counter.
+# The 'hits' counter takes its range from the preset's hit count and adds up the session's total hits.
+DEFAULT_GRAPH = {
+    'counters': {'hits': {'min': 1, 'max': 3}},
+    'phases': [
+        {'name': 'Edging', 'next': 'Prepare'},
+        {'name': 'Prepare', 'sound': 'prepare', 'draw': 'hits', 'label': '{name} - {target} hit', 'next': 'Hit'},
+        {'name': 'Hit', 'sound': 'hit', 'count': 'hits', 'label': '{name} - {count} of {target}', 'next': 'Hold'},
+        {'name': 'Hold', 'sound': 'hold', 'counter': 'hits', 'label': '{name} - {count} of {target}', 'next': 'Release'},
+        {'name': 'Release', 'sound': 'release', 'until': 'hits', 'loop': 'Hit', 'next': 'Edging',
+         'label': '{name} - {count} of {target}', 'label_done': '{name}'},
+    ],
+}
+
+
+# ValueError unless spec has the shape of a phase graph, so a malformed preset is refused when it is loaded
+def check_graph_spec(spec):
+    if not isinstance(spec, dict) or not isinstance(spec.get('phases'), list) or not spec['phases']:
+        raise ValueError('a phase graph needs a non-empty list of phases')
+    counters = spec.get('counters', {})
+    if not isinstance(counters, dict):
+        raise ValueError('counters must map counter names to their ranges')
+    for name, counter in counters.items():
+        if not isinstance(counter, dict) or not all(type(counter.get(key, 0)) is int for key in ('min', 'max')):
+            raise ValueError(f'counter {name!r} needs whole number min and max')
+    for i, phase in enumerate(spec['phases']):
+        if not isinstance(phase, dict) or not isinstance(phase.get('name'), str):
+            raise ValueError(f'phase {i + 1} needs a name')
+        for key in ('next', 'loop', 'draw', 'count', 'until', 'counter', 'sound', 'label', 'label_done'):
+            if key in phase and not isinstance(phase[key], str):
+                raise ValueError(f'{key} of phase {phase["name"]} must be a string')
+
+
+# A phase graph compiled into flat per-phase columns, so a transition is a handful of index lookups.
+# Counters and phases are referred to by index, -1 meaning none.
+class PhaseGraph:
+    def __init__(self, spec):
+        check_graph_spec(spec)
+        self.spec = spec
+        phases = spec['phases']
+        self.names = [phase['name'] for phase in phases]
+        phase_index = {name: i for i, name in enumerate(self.names)}
+        if len(phase_index) != len(self.names):
+            raise ValueError('phase names must be unique')
+        counters = spec.get('counters', {})
+        self.counter_names = list(counters)
+        counter_index = {name: i for i, name in enumerate(self.counter_names)}
+        self.counter_ranges = [(counter.get('min', 0), counter.get('max', 0)) for counter in counters.values()]
+        self.hits = counter_index.get('hits', -1)
+
+        def counter(name):
+            if name is None:
+                return -1
+            if name not in counter_index:
+                raise ValueError(f'unknown counter {name}')
+            return counter_index[name]
+
+        def phase(name):
+            if name not in phase_index:
+                raise ValueError(f'unknown phase {name}')
+            return phase_index[name]
+
+        self.sound_slots = [phase.get('sound', '') for phase in phases]
+        self.labels = [phase.get('label', '{name}') for phase in phases]
+        self.labels_done = [phase.get('label_done', phase.get('label', '{name}')) for phase in phases]
+        for label in self.labels + self.labels_done:  # A bad label would otherwise fail mid-session
+            try:
+                label.format(name='', count=0, target=0)
+            except (KeyError, IndexError, ValueError, AttributeError, TypeError) as e:
+                raise ValueError(f'invalid label {label!r}: {e!r}')
+        self.draw = array('h', [counter(phase.get('draw')) for phase in phases])
+        self.count = array('h', [counter(phase.get('count')) for phase in phases])
+        self.until = array('h', [counter(phase.get('until')) for phase in phases])
+        self.counter = array('h', [counter(phase.get('counter') or phase.get('draw') or phase.get('count') or phase.get('until'))
+                                   for phase in phases])
+        self.next = array('h', [phase(spec_phase['next']) if 'next' in spec_phase else (i + 1) % len(phases)
+                                for i, spec_phase in enumerate(phases)])
+        self.loop = array('h', [phase(spec_phase['loop']) if 'loop' in spec_phase else self.next[i]
+                                for i, spec_phase in enumerate(phases)])
+
+    def __len__(self):
+        return len(self.names)
+
+    # Counter ranges with the hit count range filled in
+    def ranges(self, hit_count_min, hit_count_max):
+        ranges = list(self.counter_ranges)
+        if self.hits >= 0:
+            ranges[self.hits] = (hit_count_min, hit_count_max)
+        return ranges
+
+
+DEFAULT_PHASE_GRAPH = PhaseGraph(DEFAULT_GRAPH)
+
+
+# Phase graph of a preset, the built-in one unless the preset has a ('Graph', spec) entry
+def preset_graph(preset):
+    for entry in preset:
+        if entry[0] == 'Graph':
+            return PhaseGraph(entry[1])
+    return DEFAULT_PHASE_GRAPH
+
+
+# One timer per phase of the graph, with the bundled cue of its sound slot
+def graph_timers(graph, colors=None):
+    return [Timer(name, 0, 0, colors[i] if colors else "", f'{slot}.wav' if slot else "")
+            for i, (name, slot) in enumerate(zip(graph.names, graph.sound_slots))]
+
+
+# The five built-in phases with their bundled cues
+def default_timers():
+    timers = graph_timers(DEFAULT_PHASE_GRAPH, ["rgba(24, 40, 84,1)", "rgba(34, 156, 23,1)", "rgba(173, 5, 39,1)",
+                                                "rgba(81, 2, 156,1)", "rgba(4, 51, 181,1)"])
+    for timer, (min_time, max_time) in zip(timers, [(120, 240), (10, 10), (5, 15), (10, 20), (5, 5)]):
+        timer.min_time = min_time
+        timer.max_time = max_time
+    return timers
+
+
+# Copy a preset in the presets file format onto the timers, rebuilding them when the preset has a
+# different set of phases. Returns the preset's phase graph and hit count range.
+def apply_preset(timers, preset):
+    graph = preset_graph(preset)
+    if [timer.name for timer in timers] != graph.names:
+        timers[:] = graph_timers(graph)
+    phases = [entry for entry in preset if not isinstance(entry[0], str)]  # Named entries are settings
+    for timer, preset_timer in zip(timers, phases):
+        timer.min_time = preset_timer[0]
+        timer.max_time = preset_timer[1]
+        timer.color = preset_timer[2]
+    return graph, preset[-1][1], preset[-1][2]
+
+
+MAX_PHASE_SECONDS = 2 ** 32 - 1  # Plans keep whole seconds in array('I')
+MAX_COUNT = 2 ** 16 - 1  # and counts in array('H')
+
+
+# ValueError naming the first phase time or counter range a plan can't be drawn from
+def check_settings(timers, ranges):
+    for timer in timers:
+        if not (0 <= timer.min_time <= MAX_PHASE_SECONDS and 0 <= timer.max_time <= MAX_PHASE_SECONDS):
+            raise ValueError(f'{timer.name} times must be between 0 and {MAX_PHASE_SECONDS} seconds')
+    for low, high in ranges:
+        if not 0 <= low <= high <= MAX_COUNT:
+            raise ValueError(f'Counts must be between 0 and {MAX_COUNT}, and the minimum no more than the maximum')
+
+
+# A whole session drawn up front from a seed by walking the phase graph: the phase, duration,
+# and the count and target of the phase's counter for every step.
+# Sessions loop forever, so further steps are drawn from the same generator as playback needs them,
+# which makes the same seed and settings always produce the same session.
+class SessionPlan:
+    def __init__(self, graph, timers, hit_count_min, hit_count_max, seed):
+        self.graph = graph
+        self.timers = timers
+        self.ranges = graph.ranges(hit_count_min, hit_count_max)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.phases = array('H')  # Phase index per step
+        self.durations = array('I')  # Whole seconds per step
+        self.counts = array('H')  # Count of the phase's counter after the step's actions
+        self.targets = array('H')  # Target of the phase's counter
+        self.done = array('B')  # 1 if the step ended a loop
+        self.next_phase = 0
+        self.counter_counts = [0] * len(self.ranges)
+        self.counter_targets = [0] * len(self.ranges)
+
+    def __len__(self):
+        return len(self.phases)
+
+    def extend(self, steps=32):
+        check_settings(self.timers, self.ranges)  # Fail here rather than half way through appending a step
+        graph = self.graph
+        counts = self.counter_counts
+        targets = self.counter_targets
+        for _ in range(steps):
+            index = self.next_phase
+            self.phases.append(index)
+            self.durations.append(max(1, int(self.timers[index].start(self.rng))))  # A 0 s phase would never let poll() return
+            draw = graph.draw[index]
+            if draw >= 0:
+                targets[draw] = self.rng.randint(*self.ranges[draw])
+                counts[draw] = 0
+            if graph.count[index] >= 0:
+                counts[graph.count[index]] += 1
+            counter = graph.counter[index]
+            self.counts.append(counts[counter] if counter >= 0 else 0)
+            self.targets.append(targets[counter] if counter >= 0 else 0)
+            until = graph.until[index]
+            if until < 0 or counts[until] >= targets[until]:
+                self.next_phase = graph.next[index]
+                self.done.append(until >= 0)
+            else:
+                self.next_phase = graph.loop[index]
+                self.done.append(0)
+
+    def step(self, step):
+        while step >= len(self.phases):
+            self.extend()
+        return self.phases[step], self.durations[step], self.counts[step], self.targets[step], self.done[step]
+
+
+# Manually driven clock for tests and simulations, call it like time.monotonic
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+# Emitted to every listener when the session enters a new phase
+class Transition:
+    __slots__ = ('index', 'name', 'color', 'sound_effect', 'duration', 'deadline', 'label',
+                 'hit_count', 'temp_hit_counter', 'hit_counter')
+
+    def __init__(self, index, name, color, sound_effect, duration, deadline, label,
+                 hit_count, temp_hit_counter, hit_counter):
+        self.index = index
+        self.name = name
+        self.color = color
+        self.sound_effect = sound_effect
+        self.duration = duration
+        self.deadline = deadline
+        self.label = label
+        self.hit_count = hit_count
+        self.temp_hit_counter = temp_hit_counter
+        self.hit_counter = hit_counter
+
+
+# Session state machine over a phase graph, free of any Qt dependency.
+# Time only moves forward when poll() is called, so the caller decides how to wait.
+# Each transition just plays back the next step of a SessionPlan.
+class Session:
+    def __init__(self, timers, hit_count_min, hit_count_max, clock=time.monotonic, graph=DEFAULT_PHASE_GRAPH):
+        self.graph = graph
+        self.timers = timers
+        self.hit_count_min = hit_count_min
+        self.hit_count_max = hit_count_max
+        self.clock = clock
+        self.listeners = []
+        self.running = False
+        self.timer_index = 0
+        self.hit_count = 0
+        self.temp_hit_counter = 0
+        self.hit_counter = 0
+        self.plan = None
+        self.step = 0
+        self.phase_deadline = 0.0
+        self.phase_duration = 0
+        self.label = ''
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    # Pass the seed of an earlier session to replay it exactly
+    def start(self, seed=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.plan = SessionPlan(self.graph, self.timers, self.hit_count_min, self.hit_count_max, seed)
+        self.step = 0
+        self.running = True
+        self.timer_index = 0
+        self.temp_hit_counter = 0
+        self.phase_deadline = self.clock()  # First transition is due immediately
+        self.poll()
+
+    def stop(self):
+        self.running = False
+
+    @property
+    def seed(self):
+        return self.plan.seed if self.plan is not None else None
+
+    # Timer of the upcoming transition, e.g. to have its sound ready
+    def next_timer(self):
+        return self.timers[self.timer_index]
+
+    def remaining(self):
+        return max(0.0, self.phase_deadline - self.clock())
+
+    # Run every transition that is due, returns how many happened
+    def poll(self):
+        now = self.clock()
+        transitions = 0
+        while self.running and now >= self.phase_deadline:
+            self.transition(now)
+            transitions += 1
+        return transitions
+
+    # Jump a FakeClock from deadline to deadline instead of waiting in real time
+    def fast_forward(self, seconds):
+        end = self.clock.now + seconds
+        while self.running and self.phase_deadline <= end:
+            self.clock.now = max(self.clock.now, self.phase_deadline)
+            self.poll()
+        self.clock.now = end
+
+    def transition(self, now):
+        index, duration, self.temp_hit_counter, self.hit_count, done = self.plan.step(self.step)
+        self.step += 1
+        timer = self.timers[index]
+
+        # Chain from the previous deadline rather than from now, so a late wake-up
+        # shortens the next phase instead of pushing the whole session back.
+        # If we fell behind by more than a whole phase (e.g. the machine slept) start over from now.
+        if self.phase_deadline + duration < now:
+            self.phase_deadline = now
+        self.phase_deadline += duration
+        self.phase_duration = duration
+
+        graph = self.graph
+        if graph.count[index] >= 0 and graph.count[index] == graph.hits:
+            self.hit_counter += 1  # Increment the hit counter
+        label = graph.labels_done[index] if done else graph.labels[index]
+        self.label = label.format(name=timer.name, count=self.temp_hit_counter, target=self.hit_count)
+        self.timer_index = self.plan.step(self.step)[0]
+
+        event = Transition(index, timer.name, timer.color, timer.sound_effect, duration, self.phase_deadline,
+                           self.label, self.hit_count, self.temp_hit_counter, self.hit_counter)
+        for listener in self.listeners:
+            listener(event)
+
+
+# Drives many independent sessions off one priority queue of their next deadlines,
+# so a single timer can wait for whichever session is due first.
+class SessionScheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.sessions = []
+        self.queue = []  # (deadline, sequence, session), entries go stale when a session moves on
+        self.sequence = itertools.count()
+
+    def add(self, session):
+        session.clock = self.clock
+        self.sessions.append(session)
+        return session
+
+    def start(self, session, seed=None):
+        session.start(seed)
+        self.schedule(session)
+
+    def start_all(self):
+        for session in self.sessions:
+            self.start(session)
+
+    def stop_all(self):
+        for session in self.sessions:
+            session.stop()
+        self.queue = []
+
+    def schedule(self, session):
+        if session.running:
+            heapq.heappush(self.queue, (session.phase_deadline, next(self.sequence), session))
+
+    # Earliest deadline of any running session, or None
+    def next_deadline(self):
+        while self.queue:
+            deadline, _, session = self.queue[0]
+            if session.running and deadline == session.phase_deadline:
+                return deadline
+            heapq.heappop(self.queue)
+        return None
+
+    # Run the transitions of every session that is due, returns how many happened
+    def poll(self):
+        now = self.clock()
+        transitions = 0
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return transitions
+            session = heapq.heappop(self.queue)[2]
+            transitions += session.poll()
+            self.schedule(session)
+
+    # Jump a FakeClock from deadline to deadline instead of waiting in real time
+    def fast_forward(self, seconds):
+        end = self.clock.now + seconds
+        transitions = 0
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > end:
+                break
+            self.clock.now = max(self.clock.now, deadline)
+            transitions += self.poll()
+        self.clock.now = end
+        return transitions
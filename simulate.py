@@ -0,0 +1,141 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from presets import DEFAULT_PRESETS, PresetStore
+from session import DEFAULT_PHASE_GRAPH, preset_graph
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# Whole-second phase durations of at least 1 s, like SessionPlan draws with Timer.start(), for n sessions at once
+def draw_durations(rng, phase, n):
+    return np.maximum(1, np.floor(rng.uniform(phase[0], phase[1], n)))
+
+
+# Draw n sessions of a preset in the App.load_preset format, in chunks to bound memory.
+# Returns session lengths in seconds and total hits per session.
+def simulate(preset, sessions, seed=None, chunk_size=1000000):
+    if preset_graph(preset) is DEFAULT_PHASE_GRAPH:
+        return simulate_default(preset, sessions, seed, chunk_size)
+    return simulate_graph(preset, sessions, seed, chunk_size)
+
+
+# The built-in cycle in closed form: Edging, Prepare, then as many Hit -> Hold -> Release rounds
+# as the hit count (at least one), several times faster than walking the graph
+def simulate_default(preset, sessions, seed=None, chunk_size=1000000):
+    edging, prepare, hit, hold, release = preset[:5]
+    hit_count_min, hit_count_max = preset[-1][1], preset[-1][2]
+    rng = np.random.default_rng(seed)
+    lengths = np.empty(sessions)
+    hits = np.empty(sessions, dtype=np.int64)
+    for start in range(0, sessions, chunk_size):
+        n = min(chunk_size, sessions - start)
+        rounds = np.maximum(1, rng.integers(hit_count_min, hit_count_max + 1, n))  # Release always follows at least one Hit
+        length = draw_durations(rng, edging, n) + draw_durations(rng, prepare, n)
+        for k in range(int(rounds.max())):
+            round_length = draw_durations(rng, hit, n) + draw_durations(rng, hold, n) + draw_durations(rng, release, n)
+            length += np.where(k < rounds, round_length, 0)
+        lengths[start:start + n] = length
+        hits[start:start + n] = rounds
+    return lengths, hits
+
+
+# Any other phase graph: one session walks it from the first phase until it comes back to it,
+# all sessions of a chunk stepping through the compiled table together
+def simulate_graph(preset, sessions, seed=None, chunk_size=1000000, max_steps=100000):
+    graph = preset_graph(preset)
+    phases = [entry for entry in preset if not isinstance(entry[0], str)]
+    mins = np.array([phase[0] for phase in phases], dtype=float)
+    maxs = np.array([phase[1] for phase in phases], dtype=float)
+    ranges = graph.ranges(preset[-1][1], preset[-1][2])
+    lows = np.array([low for low, high in ranges], dtype=np.int64)
+    highs = np.array([high for low, high in ranges], dtype=np.int64)
+    draw, count, until = (np.array(column, dtype=np.int64) for column in (graph.draw, graph.count, graph.until))
+    next_, loop = np.array(graph.next, dtype=np.int64), np.array(graph.loop, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    lengths = np.empty(sessions)
+    hits = np.empty(sessions, dtype=np.int64)
+    for start in range(0, sessions, chunk_size):
+        n = min(chunk_size, sessions - start)
+        phase = np.zeros(n, dtype=np.int64)
+        counts = np.zeros((n, max(1, len(ranges))), dtype=np.int64)
+        targets = np.zeros_like(counts)
+        length = np.zeros(n)
+        total_hits = np.zeros(n, dtype=np.int64)
+        active = np.arange(n)  # Sessions that haven't come back to the first phase yet
+        for _ in range(max_steps):
+            if active.size == 0:
+                break
+            p = phase[active]
+            # Whole-second phase durations of at least 1 s, like SessionPlan draws with Timer.start()
+            length[active] += np.maximum(1, np.floor(rng.uniform(mins[p], maxs[p])))
+            drawn = draw[p] >= 0
+            rows, columns = active[drawn], draw[p][drawn]
+            targets[rows, columns] = rng.integers(lows[columns], highs[columns] + 1)
+            counts[rows, columns] = 0
+            counted = count[p] >= 0
+            rows, columns = active[counted], count[p][counted]
+            counts[rows, columns] += 1
+            total_hits[rows[columns == graph.hits]] += 1
+            u = until[p]
+            looping = (u >= 0) & (counts[active, np.maximum(u, 0)] < targets[active, np.maximum(u, 0)])
+            phase[active] = np.where(looping, loop[p], next_[p])
+            active = active[phase[active] != 0]
+        else:
+            raise ValueError(f'sessions did not return to the first phase within {max_steps} steps')
+        lengths[start:start + n] = length
+        hits[start:start + n] = total_hits
+    return lengths, hits
+
+
+def statistics(lengths, hits, bins=20):
+    counts, edges = np.histogram(lengths, bins=bins)
+    hit_values, hit_counts = np.unique(hits, return_counts=True)
+    return {
+        'sessions': int(len(lengths)),
+        'length': {
+            'mean': float(lengths.mean()),
+            'std': float(lengths.std()),
+            'min': float(lengths.min()),
+            'max': float(lengths.max()),
+            'percentiles': {f'p{p:g}': float(value) for p, value in zip(PERCENTILES, np.percentile(lengths, PERCENTILES))},
+            'histogram': [{'start': float(edges[i]), 'end': float(edges[i + 1]), 'count': int(count)}
+                          for i, count in enumerate(counts)],
+        },
+        'hits': {
+            'mean': float(hits.mean()),
+            'distribution': {int(value): float(count) / len(hits) for value, count in zip(hit_values, hit_counts)},
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expected and tail session length of a preset')
+    parser.add_argument('preset', nargs='?', default='Default')
+    parser.add_argument('--presets', help='presets.db or presets.json to read the preset from, the built-in presets by default')
+    parser.add_argument('-n', '--sessions', type=int, default=1000000)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--bins', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.presets is None:
+        preset = DEFAULT_PRESETS[args.preset]
+    elif args.presets.endswith('.json'):
+        with open(args.presets, 'r') as f:
+            preset = json.load(f)[args.preset]
+    else:
+        preset = PresetStore(args.presets)[args.preset]
+
+    started = time.perf_counter()
+    lengths, hits = simulate(preset, args.sessions, args.seed)
+    result = statistics(lengths, hits, args.bins)
+    result['preset'] = args.preset
+    result['seconds'] = time.perf_counter() - started
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
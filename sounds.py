@@ -0,0 +1,83 @@
+import os
+import time
+from PyQt5.QtCore import QUrl
+from PyQt5.QtMultimedia import QSoundEffect
+
+
+# Keeps one decoded QSoundEffect per cue file, so a transition never has to open or decode a WAV
+class SoundCache:
+    def __init__(self, parent=None, instrumentation=None):
+        self.parent = parent
+        self.instrumentation = instrumentation
+        self.effects = {}  # path -> QSoundEffect
+        self.triggered = {}  # path -> monotonic time of the transition waiting for playback to start
+
+        # Latency counter, transition to playback start
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_latency = 0.0
+        self.path_latency = {}  # path -> last latency
+
+    # Decode a cue up front, returns None for paths that are not files (e.g. the silent Edging phase)
+    def load(self, path):
+        if path in self.effects:
+            return self.effects[path]
+        if not path or not os.path.isfile(path):
+            return None
+        effect = QSoundEffect(self.parent)
+        effect.setSource(QUrl.fromLocalFile(path))
+        effect.playingChanged.connect(lambda path=path: self.on_playing_changed(path))
+        self.effects[path] = effect
+        return effect
+
+    # Drop a cue, e.g. when the user picks a different file for it
+    def invalidate(self, path):
+        effect = self.effects.pop(path, None)
+        self.triggered.pop(path, None)
+        if effect is not None:
+            effect.stop()
+            effect.deleteLater()
+
+    # Keep only the given cues decoded, loading any that are new
+    def retain(self, paths):
+        for path in list(self.effects):
+            if path not in paths:
+                self.invalidate(path)
+        for path in paths:
+            self.load(path)
+
+    # Play a cue, transition_time is the monotonic time the phase change was due
+    def play(self, path, transition_time=None):
+        effect = self.load(path)
+        if effect is None:
+            return False
+        self.triggered[path] = time.monotonic() if transition_time is None else transition_time
+        effect.play()
+        return True
+
+    def on_playing_changed(self, path):
+        effect = self.effects.get(path)
+        if effect is None or not effect.isPlaying() or path not in self.triggered:
+            return
+        latency = time.monotonic() - self.triggered.pop(path)
+        self.last_latency = latency
+        self.path_latency[path] = latency
+        self.latency_count += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        if self.instrumentation is not None:
+            self.instrumentation.record('sound_delay', latency)
+
+    # Whether a cue is decoded and ready to start playing straight away
+    def status(self, path):
+        effect = self.effects.get(path)
+        if effect is None:
+            return 'not loaded'
+        return {QSoundEffect.Ready: 'decoded', QSoundEffect.Loading: 'loading',
+                QSoundEffect.Error: 'error'}.get(effect.status(), 'not loaded')
+
+    def mean_latency(self):
+        if self.latency_count == 0:
+            return 0.0
+        return self.latency_total / self.latency_count
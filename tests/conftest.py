@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app is a set of flat modules next to this directory, and the Qt tests run without a display.
+# app.py picks its config directory on import, so presets and history go to a throwaway one.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ['XDG_CONFIG_HOME'] = os.environ['APPDATA'] = tempfile.mkdtemp(prefix='ptaw-tests-')
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('PyQt5.QtWidgets')
+
+import app
+import history
+from bench import rss_mb
+from presets import DEFAULT_PRESETS
+from session import FakeClock
+
+
+# Every session's 'start' record comes before its first phase
+def test_history_starts_before_the_first_phase(qapp):
+    window = app.App(seed=7)
+    window.start_timers()
+    window.stop_timers()
+    window.history.close()
+    records = [(record['k'], record['s']) for record in history.read_records(window.history.directory)]
+    assert records[-3:] == [('start', 7), ('phase', 7), ('stop', 7)]
+    window.close()
+
+
+# Settings is built once and reused, so opening it over and over neither piles up dialogs nor memory
+def test_settings_reopen_keeps_memory_flat(qapp):
+    window = app.App()
+    window.show()
+    window.load_startup_presets()
+
+    def cycle(times):
+        for _ in range(times):
+            window.open_settings()
+            qapp.processEvents()
+            window.settings_window.close()
+            qapp.processEvents()
+
+    cycle(50)  # Warm up caches and the allocator
+    before = rss_mb()
+    cycle(1000)
+    growth = rss_mb() - before
+    dialogs = [widget for widget in qapp.topLevelWidgets() if isinstance(widget, app.SettingsWindow)]
+    assert len(dialogs) == 1
+    assert growth < 2
+    window.history.close()
+    window.close()
+
+
+# repaint_cost is only recorded once Qt has actually painted the transition
+def test_repaint_cost_includes_the_paint(qapp):
+    window = app.App(seed=1)
+    window.show()
+    window.load_startup_presets()
+    window.session.clock = FakeClock(1000.0)
+    window.start_timers()
+    window.phase_timer.stop()
+    qapp.processEvents()
+    window.session.clock.now = window.session.phase_deadline
+    window.update_timer()
+    assert window.instrumentation.buffers['repaint_cost'].count == 0
+    qapp.processEvents()
+    assert window.instrumentation.buffers['repaint_cost'].count == 1
+    window.stop_timers()
+    window.history.close()
+    window.close()
+
+
+# With nothing in the library the app starts on the built-in Default preset instead of failing
+def test_empty_library_falls_back_to_the_default_preset(qapp, tmp_path, monkeypatch):
+    (tmp_path / 'presets.json').write_text('{"Mine": [[1, 2,')
+    monkeypatch.setattr(app, 'presets_store_file', str(tmp_path / 'presets.db'))
+    window = app.App()
+    window.load_startup_presets()
+    assert len(window.presets) == 0
+    assert (window.hit_count_min, window.hit_count_max) == tuple(DEFAULT_PRESETS['Default'][-1][1:])
+    window.history.close()
+    window.close()
+
+
+# The cue library names the file the user picked, not the hashed copy in the cue cache
+def test_cue_library_shows_the_source_file(qapp):
+    window = app.App()
+    source = os.path.join('/music', 'gong.wav')
+    future = Future()
+    future.set_result(os.path.join('/cache', 'cues', f'{"0" * 64}.wav'))
+    window.on_cue_ingested(future, (source, lambda cue: setattr(window, 'hit_sound_path', cue), None))
+    library = app.CueLibraryDialog(window)
+    library.refresh()
+    row = [attribute for name, attribute in library.cues].index('hit_sound_path')
+    assert library.table.item(row, 1).text() == 'gong.wav'
+    assert library.table.item(row, 1).toolTip() == source
+    window.history.close()
+    window.close()
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from broadcast import Follower, Publisher
+from instrumentation import percentile
+
+SKEW = 1234.5  # The publisher's clock reads this much later than ours, as another machine's would
+
+
+# A publisher on a skewed clock with followers connected and their clocks synced.
+# Returns the publisher, the followers and the list their messages arrive in as (time, message).
+def connect(followers, skew, **options):
+    publisher = Publisher(port=0, clock=lambda: time.monotonic() + skew[0]).start()
+    received = []
+    arrived = threading.Semaphore(0)
+    lock = threading.Lock()
+
+    def on_message(message):
+        with lock:
+            received.append((time.monotonic(), message))
+        arrived.release()
+
+    clients = [Follower('127.0.0.1', publisher.port, on_message, **options).start() for _ in range(followers)]
+    for client in clients:
+        assert client.connected.wait(5)
+    time.sleep(0.5)  # Let the clock sync pings settle
+    return publisher, clients, received, arrived
+
+
+def close(publisher, clients):
+    for client in clients:
+        client.close()
+    publisher.close()
+
+
+# Dozens of followers get every transition within 20 ms of publish(), with the deadline
+# translated onto their own clock to within 20 ms
+def test_dozens_of_followers_within_20_ms():
+    followers, messages = 32, 100
+    publisher, clients, received, arrived = connect(followers, [SKEW])
+    published = {}
+    for i in range(messages):
+        published[i] = time.monotonic()
+        publisher.publish({'k': 'phase', 'n': 'Hit', 'd': 5, 'dl': published[i] + SKEW + 5, 'h': i})
+        for _ in range(followers):
+            assert arrived.acquire(timeout=5)
+    close(publisher, clients)
+
+    delays = sorted((arrival - published[message['h']]) * 1000 for arrival, message in received)
+    errors = sorted(abs(message['ldl'] - published[message['h']] - 5) * 1000 for arrival, message in received)
+    assert len(delays) == followers * messages
+    assert percentile(delays, 99) < 20
+    assert percentile(errors, 99) < 20
+
+
+# When the clocks drift apart the offset follows within a few pings, instead of keeping the first good sample
+def test_offset_follows_clock_drift():
+    skew = [SKEW]
+    publisher, clients, received, arrived = connect(4, skew, ping_interval=0.05, window=4)
+    skew[0] += 0.1  # 100 ms of drift, about three hours at 10 ppm
+    time.sleep(1)
+    now = time.monotonic()
+    publisher.publish({'k': 'phase', 'n': 'Hit', 'd': 5, 'dl': now + skew[0] + 5, 'h': 0})
+    for _ in clients:
+        assert arrived.acquire(timeout=5)
+    close(publisher, clients)
+    for arrival, message in received:
+        assert abs(message['ldl'] - now - 5) < 0.02
@@ -0,0 +1,120 @@
+import os
+import struct
+import wave
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import ingest as ingest_module
+from ingest import MAX_PEAK, OUTPUT_RATE, TARGET_RMS, IngestError, duration, ingest, resample
+
+
+# A WAV file with the given format chunk fields, WAVE_FORMAT_EXTENSIBLE if subformat is set
+def write_wav(path, samples, encoding, rate, bits, subformat=None):
+    channels = samples.shape[1]
+    align = channels * bits // 8
+    fmt = struct.pack('<HHIIHH', encoding, channels, rate, rate * align, align, bits)
+    if subformat is not None:
+        fmt += struct.pack('<HHIH', 22, bits, 3, subformat) + bytes(14)
+    data = samples.tobytes()
+    body = b'WAVEfmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(data)) + data
+    path.write_bytes(b'RIFF' + struct.pack('<I', len(body)) + body)
+    return str(path)
+
+
+# Frames of a processed cue as floats
+def read_cue(path):
+    with wave.open(path) as f:
+        return np.frombuffer(f.readframes(f.getnframes()), '<i2').reshape(-1, 2) / (2 ** 15 - 1)
+
+
+def tone(rate, seconds=0.5):
+    t = np.arange(int(rate * seconds)) / rate
+    return np.repeat((0.3 * np.sin(2 * np.pi * 440 * t))[:, None], 2, axis=1)
+
+
+@pytest.mark.parametrize('encoding, subformat, dtype, scale', [
+    (3, None, '<f4', 1),  # IEEE float
+    (0xFFFE, 1, '<i2', 32767),  # Extensible PCM
+    (0xFFFE, 3, '<f4', 1),  # Extensible float
+])
+def test_float_and_extensible_files_are_converted(tmp_path, encoding, subformat, dtype, scale):
+    path = write_wav(tmp_path / 'cue.wav', (tone(22050) * scale).astype(dtype), encoding, 22050,
+                     np.dtype(dtype).itemsize * 8, subformat)
+    assert duration(path) == pytest.approx(0.5)
+    with wave.open(ingest(path, str(tmp_path / 'cues'))) as f:
+        assert (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (44100, 2, 2)
+
+
+@pytest.mark.parametrize('rate, bits, encoding', [(0, 16, 1), (44100, 0, 1), (8000, 8, 6)])
+def test_corrupt_and_unsupported_files_are_rejected(tmp_path, rate, bits, encoding):
+    path = write_wav(tmp_path / 'cue.wav', np.zeros((100, 2), '<i2'), encoding, rate, bits)
+    with pytest.raises(IngestError):
+        ingest(path, str(tmp_path / 'cues'))
+    assert duration(path) is None
+
+
+# The length comes from the header, so an hour of audio is refused without the file being read or hashed
+def test_long_files_are_rejected_before_they_are_read(tmp_path, monkeypatch):
+    path = write_wav(tmp_path / 'cue.wav', np.zeros((100, 2), '<i2'), 1, 44100, 16)
+    with open(path, 'r+b') as f:
+        f.seek(40)
+        f.write(struct.pack('<I', 3600 * 44100 * 4))
+        f.truncate(44 + 3600 * 44100 * 4)  # Sparse, takes no space on disk
+    monkeypatch.setattr('hashlib.sha256', lambda *args: pytest.fail('a rejected file was hashed'))
+    with pytest.raises(IngestError, match='3600 seconds'):
+        ingest(path, str(tmp_path / 'cues'))
+
+
+# Downsampling filters out what the new rate can't hold instead of folding it back down as an alias
+def test_downsampling_does_not_alias():
+    t = np.arange(96000) / 96000
+    samples = np.repeat(np.sin(2 * np.pi * np.array([1000, 30000]) * t[:, None]).sum(axis=1, keepdims=True), 2, axis=1)
+    spectrum = np.abs(np.fft.rfft(resample(samples.astype(np.float32), 96000)[:, 0])) / 22050  # 1 Hz bins
+    assert spectrum[1000] == pytest.approx(1, abs=0.01)
+    assert spectrum[44100 - 30000] < 1e-3
+
+
+@pytest.mark.parametrize('rate, seconds', [(22050, 0.5), (48000, 1), (96000, 0.25), (44100, 0.5)])
+def test_resampled_length(tmp_path, rate, seconds):
+    path = write_wav(tmp_path / 'cue.wav', (tone(rate, seconds) * 32767).astype('<i2'), 1, rate, 16)
+    assert len(read_cue(ingest(path, str(tmp_path / 'cues')))) == pytest.approx(OUTPUT_RATE * seconds, abs=1)
+
+
+# Leading silence goes, apart from 5 ms so the attack isn't clipped
+def test_leading_silence_is_trimmed(tmp_path):
+    samples = np.concatenate([np.zeros((OUTPUT_RATE // 5, 2)), np.full((OUTPUT_RATE // 10, 2), 0.3)])
+    path = write_wav(tmp_path / 'cue.wav', (samples * 32767).astype('<i2'), 1, OUTPUT_RATE, 16)
+    cue = read_cue(ingest(path, str(tmp_path / 'cues')))
+    assert len(cue) == OUTPUT_RATE // 10 + OUTPUT_RATE // 200
+    assert not cue[:OUTPUT_RATE // 200].any()
+    assert cue[OUTPUT_RATE // 200:].all()
+
+
+# Loud and quiet cues come out at the same RMS level
+@pytest.mark.parametrize('amplitude', [0.01, 0.9])
+def test_loudness_is_normalised_to_the_rms_target(tmp_path, amplitude):
+    path = write_wav(tmp_path / 'cue.wav', (tone(OUTPUT_RATE) / 0.3 * amplitude * 32767).astype('<i2'), 1, OUTPUT_RATE, 16)
+    cue = read_cue(ingest(path, str(tmp_path / 'cues')))
+    assert np.sqrt(np.mean(cue ** 2)) == pytest.approx(TARGET_RMS, rel=0.01)
+
+
+# A cue that would peak above -1 dBFS at the RMS target is only brought up to the peak ceiling
+def test_peaks_are_held_below_the_ceiling(tmp_path):
+    samples = np.full((OUTPUT_RATE // 2, 2), 0.001)
+    samples[OUTPUT_RATE // 4] = 0.5  # A click in an otherwise quiet cue
+    path = write_wav(tmp_path / 'cue.wav', (samples * 32767).astype('<i2'), 1, OUTPUT_RATE, 16)
+    cue = read_cue(ingest(path, str(tmp_path / 'cues')))
+    assert np.abs(cue).max() == pytest.approx(MAX_PEAK, abs=1e-3)
+    assert np.sqrt(np.mean(cue ** 2)) < TARGET_RMS
+
+
+# The same content is only processed once, wherever it is picked from
+def test_same_content_reuses_the_cached_cue(tmp_path, monkeypatch):
+    samples = (tone(22050) * 32767).astype('<i2')
+    cache = str(tmp_path / 'cues')
+    first = ingest(write_wav(tmp_path / 'a.wav', samples, 1, 22050, 16), cache)
+    monkeypatch.setattr(ingest_module, 'process', lambda *args: pytest.fail('cached content was processed again'))
+    assert ingest(write_wav(tmp_path / 'b.wav', samples, 1, 22050, 16), cache) == first
+    assert sorted(os.listdir(cache)) == [os.path.basename(first)]
@@ -0,0 +1,31 @@
+import json
+
+from presets import DEFAULT_PRESETS, PresetStore
+
+
+def test_new_store_gets_the_built_in_presets(tmp_path):
+    store = PresetStore(str(tmp_path / 'presets.db'))
+    assert list(store) == list(DEFAULT_PRESETS)
+    store.close()
+
+
+def test_presets_json_is_migrated(tmp_path):
+    (tmp_path / 'presets.json').write_text(json.dumps({'Mine': DEFAULT_PRESETS['Default']}))
+    store = PresetStore(str(tmp_path / 'presets.db'))
+    assert list(store) == ['Mine']
+    store.close()
+
+
+# A presets.json torn by a crash leaves the store empty rather than failing, every time it's opened,
+# and the migration still happens once the file is readable again
+def test_corrupt_presets_json_is_retried(tmp_path):
+    legacy = tmp_path / 'presets.json'
+    legacy.write_text(json.dumps({'Mine': DEFAULT_PRESETS['Default']})[:40])
+    for _ in range(2):
+        store = PresetStore(str(tmp_path / 'presets.db'))
+        assert len(store) == 0
+        store.close()
+    legacy.write_text(json.dumps({'Mine': DEFAULT_PRESETS['Default']}))
+    store = PresetStore(str(tmp_path / 'presets.db'))
+    assert list(store) == ['Mine']
+    store.close()
@@ -0,0 +1,90 @@
+import random
+import time
+
+import pytest
+
+from session import FakeClock, PhaseGraph, Session, default_timers
+
+
+# An hour of phases, every transition woken up as late as a busy machine would,
+# still ends within 5 ms of the sum of the phase durations
+def test_no_drift_across_an_hour():
+    clock = FakeClock(1000.0)
+    session = Session(default_timers(), 2, 3, clock)
+    durations = []
+    session.subscribe(lambda event: durations.append(event.duration))
+    session.start(seed=1)
+    start = session.phase_deadline - session.phase_duration
+    lateness = random.Random(1)
+    while clock.now < start + 3600:
+        clock.now = session.phase_deadline + lateness.uniform(0, 0.05)
+        session.poll()
+    assert len(durations) > 20
+    assert abs(session.phase_deadline - start - sum(durations)) < 0.005
+
+
+# The engine has to be cheap enough to run thousands of whole sessions a second headless
+def test_thousands_of_sessions_per_second():
+    timers = default_timers()
+    sessions = 2000
+    started = time.perf_counter()
+    cycles = 0
+    for seed in range(sessions):
+        clock = FakeClock()
+        session = Session(timers, 2, 3, clock)
+        session.start(seed)
+        session.fast_forward(400)  # Longer than the longest Default session
+        cycles += session.plan.phases[:session.step].count(0)
+    elapsed = time.perf_counter() - started
+    assert cycles >= sessions
+    assert sessions / elapsed > 1000
+
+
+# Phases shorter than a second still take one, instead of poll() never catching up
+def test_sub_second_phases_do_not_hang():
+    timers = default_timers()
+    for timer in timers:
+        timer.min_time, timer.max_time = 0, 0.5
+    clock = FakeClock()
+    session = Session(timers, 2, 3, clock)
+    session.start(seed=1)
+    assert session.phase_duration == 1
+    session.fast_forward(60)
+    assert session.step == 61  # One phase started at 0 s, then one every second
+
+
+# Times and counts the plan's arrays can't hold are refused up front with a ValueError
+def test_invalid_settings_are_refused():
+    timers = default_timers()
+    timers[2].min_time = -1
+    with pytest.raises(ValueError):
+        Session(timers, 2, 3, FakeClock()).start(seed=1)
+    with pytest.raises(ValueError):
+        Session(default_timers(), 2, 70000, FakeClock()).start(seed=1)
+
+
+# Malformed graphs and broken label format strings are refused when the graph is compiled,
+# always as ValueError, so loading a bad preset never fails mid-session
+@pytest.mark.parametrize('spec', [
+    {'phases': [{'name': 'A', 'label': '{cnt}'}]},
+    {'phases': [{'name': 'A', 'label': '{count'}]},
+    {'phases': [{'name': 'A', 'label': '{0}'}]},
+    {'phases': [{'name': 'A', 'label': '{name.x}'}]},
+    {'phases': [{'nam': 'A'}]},
+    {},
+    [],
+    {'phases': []},
+    {'phases': {'name': 'A'}},
+    {'phases': ['A']},
+    {'phases': [{'name': 'A', 'next': 'B'}]},
+    {'phases': [{'name': 'A', 'next': 0}]},
+    {'phases': [{'name': 'A', 'loop': ['A']}]},
+    {'phases': [{'name': 'A'}, {'name': 'A'}]},
+    {'counters': {'hits': 5}, 'phases': [{'name': 'A'}]},
+    {'counters': {'hits': {'min': '1'}}, 'phases': [{'name': 'A'}]},
+    {'counters': ['hits'], 'phases': [{'name': 'A'}]},
+    {'phases': [{'name': 'A', 'draw': 'sets'}]},
+])
+def test_bad_graphs_are_refused_at_compile_time(spec):
+    with pytest.raises(ValueError):
+        PhaseGraph(spec)
@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from presets import DEFAULT_PRESETS
+from simulate import simulate_default, simulate_graph
+
+
+# The closed form used for the built-in cycle and the general graph walk draw the same sessions
+@pytest.mark.parametrize('name', list(DEFAULT_PRESETS))
+def test_closed_form_matches_graph_walk(name):
+    preset = DEFAULT_PRESETS[name]
+    lengths, hits = simulate_default(preset, 200000, seed=1)
+    graph_lengths, graph_hits = simulate_graph(preset, 200000, seed=2)
+    assert lengths.mean() == pytest.approx(graph_lengths.mean(), rel=0.005)
+    assert hits.mean() == pytest.approx(graph_hits.mean(), rel=0.005)
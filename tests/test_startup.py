@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('PyQt5.QtWidgets')
+
+from bench import bench_startup
+
+MAX_FIRST_WINDOW_MS = 500  # About 100 ms on a plain Linux box, so only a real regression trips this
+
+
+def test_time_to_first_window():
+    result = bench_startup(runs=3)
+    assert result['time_to_first_window_ms'] < MAX_FIRST_WINDOW_MS
+
+
+# Audio, networking and cue processing stay out of the import path to the first window
+def test_heavy_modules_are_imported_lazily():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = 'import sys, app; print(" ".join(sorted(set(sys.modules) & {"PyQt5.QtMultimedia", "asyncio", "numpy", "ingest", "broadcast"})))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ''